@@ -5,8 +5,8 @@ import traceback
 from tempfile import NamedTemporaryFile
 
 from utils import app
-from utils.servers import get_server, load_servers, DATACENTER
-from utils.files import get_md5sum, chmod, remove
+from utils.servers import ServerPool, DATACENTER, NOT_MODIFIED
+from utils.files import DigestCache, chmod, remove
 from rmq import Worker
 from ivsdb import IVSdata
 from vgosdb.correlator import CorrelatorReport
@@ -26,6 +26,11 @@ class AuxFiles(Worker):
         self.set_start_time('now')
 
         self.downloader = {'aux_corr': self.download_corr}
+        # Cache of md5 and remote fingerprints of downloaded files
+        self.digests = DigestCache(app.Applications.VLBI.get('aux_digests', '~/.aux-digests.sqlite3'))
+        # Connections to data centers and database are kept between messages
+        self.servers = ServerPool(app.Applications.AUXfiles.get('idle_timeout', 300))
+        self.dbase = None
 
     # Using regex definitions in server control file, create filters to detect file types.
     @staticmethod
@@ -39,38 +44,54 @@ class AuxFiles(Worker):
         try:
             # Make temporary file for download
             path = NamedTemporaryFile(delete=False).name
-            # Download file
-            load_servers(DATACENTER)
-            with get_server(DATACENTER, center) as server:
+            # Download file if changed since last download
+            fingerprint = self.digests.remote(lpath) if checksum else None
+            with self.servers.connection(DATACENTER, center) as server:
                 rpath = os.path.join(server.root, rpath)
-                ok, rmd5sum = server.download(rpath, path)
-            return CorrelatorReport(path).save(lpath) if ok else (ok, rmd5sum)
+                ok, rmd5sum, remote = server.conditional_download(rpath, path, fingerprint)
+            if rmd5sum == NOT_MODIFIED:
+                remove(path)
+                return False, NOT_MODIFIED
+            if not ok:
+                return ok, rmd5sum
+            ok, info = CorrelatorReport(path).save(lpath)
+            if os.path.exists(lpath):
+                self.digests.set(lpath, rmd5sum, remote)
+            return ok, info
 
         except Exception as err:
             self.notify(f'Error downloading {rpath}\n{str(err)}')
             return False, str(err)
 
-    # Download file to local server and replace if checksum not the same
+    # Download file to local server and replace if checksum not the same.
+    # File is not transferred if remote fingerprint (etag, size, mtime) is same as last download.
     def download(self, center, rpath, lpath, checksum=False):
         try:
             # Make temporary file for download
             path = NamedTemporaryFile(delete=False).name if checksum else lpath
+            fingerprint = self.digests.remote(lpath) if checksum else None
             # Download file
-            load_servers(DATACENTER)
-            with get_server(DATACENTER, center) as server:
+            with self.servers.connection(DATACENTER, center) as server:
                 rpath = os.path.join(server.root, rpath)
-                ok, rmd5sum = server.download(rpath, path)
+                ok, rmd5sum, remote = server.conditional_download(rpath, path, fingerprint)
 
+            if rmd5sum == NOT_MODIFIED:
+                remove(path)
+                return False, NOT_MODIFIED  # Do not process since it is the same file
             if not ok or not checksum:
                 chmod(lpath)
+                if ok:
+                    self.digests.set(lpath, rmd5sum, remote)
                 return ok, rmd5sum
-            # Test if it should be replaced
-            if get_md5sum(lpath) == rmd5sum:
+            # Test if it should be replaced (md5 of local file from cache)
+            if self.digests.md5(lpath) == rmd5sum:
                 remove(path)
+                self.digests.set(lpath, rmd5sum, remote)
                 return False, 'MD5 same'  # Do not process since it is the same file
             # Replace old with tmp file
             shutil.move(path, lpath)
             chmod(lpath)
+            self.digests.set(lpath, rmd5sum, remote)
             return ok, 'overwrite it'
         except Exception as err:
             self.notify(f'Error downloading {rpath}\n{str(err)}')
@@ -96,8 +117,8 @@ class AuxFiles(Worker):
             return
 
         update, processed, msg = False, False, 'None'
-        url, tunnel = app.get_dbase_info()
-        with IVSdata(url, tunnel) as dbase:
+        dbase = self.get_dbase()
+        try:
             if ses := dbase.get_session(ses_id):  # Found session id in data base
                 lpath = os.path.join(ses.folder, name)
                 download = self.downloader.get(code, self.download)
@@ -122,16 +143,32 @@ class AuxFiles(Worker):
                 dbase.update_recent_file(name, timestamp)
             else:
                 self.info(f'{name} from {center} not processed [{code}] {msg}')
-                if 'MD5 same' in msg:
+                if 'MD5 same' in msg or msg == NOT_MODIFIED:
                     update = True
             if update:
                 dbase.update_recent_file(name, timestamp)
+        finally:
+            dbase.orm_ses.remove()  # Do not keep records between messages
+
+    # Open database once. Engine is using pre_ping to test connection before each use.
+    def get_dbase(self):
+        if not self.dbase:
+            url, tunnel = app.get_dbase_info()
+            self.dbase = IVSdata(url, tunnel)
+            self.dbase.open()
+        return self.dbase
+
+    # Close idle connections to data centers
+    def process_timeout(self):
+        self.servers.clean()
+        super().process_timeout()
 
     # Process message from rmq queue
     def process_msg(self, ch, method, properties, body):
         try:
             center, name, rpath, timestamp = body.decode('utf-8').strip().split(',', 3)
             self.process_file(center, name, rpath, timestamp)
+            self.servers.clean()
         except Exception as err:
             self.notify(f'problem {name} {center}\n{str(err)}\n{traceback.format_exc()}')
 
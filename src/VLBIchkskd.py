@@ -5,7 +5,7 @@ from datetime import datetime, timedelta, time
 
 from utils import app
 from utils.servers import get_server, load_servers, get_centers, DATACENTER
-from utils.mail import build_message, send_message
+from utils.mail import build_message, queue_message
 from rmq import Worker
 from ivsdb import IVSdata
 
@@ -113,28 +113,32 @@ class CheckSkd(Worker):
 
             msg = build_message(self.ivscc['sender'], self.ops_centers[oc], subject, reply=self.ivscc['reply-to'],
                                 text=text, html=html, urgent=urgent)
-            if err := send_message(self.mail_server, msg):
+            # Message is sent by background thread. Failure is reported when it happens.
+            def on_error(err, oc=oc, subject=subject, text=text):
                 self.notify(f'Failed sending message to {oc}.', f'[{err}]\nOperations Center {oc}\n{subject}\n\n{text}',
                             wait=False)
+            if queue_message(self.mail_server, msg, on_error=on_error):
+                self.info(f'{"urgent " if urgent else ""}email queued for {oc}')
             else:
-                self.info(f'{"urgent " if urgent else ""}email sent to {oc}')
+                self.info(f'same email already sent to {oc}')
 
         return nbr_missing
 
-    # Check on IVS Data Centers if schedule is available
-    def check_session(self, ses):
-        # Check if schedule in our session folder
-        for code in self.file_codes:
-            if ses.file_path(code).exists():
-                return
-        # Check if skd or vex on any IVS data center
+    # Get names of all files in aux folders of these sessions. Year folder of each data center is listed once
+    # and only existing session folders are listed.
+    def list_aux_files(self, sessions):
+        names, years = set(), {}
+        for ses in sessions:
+            years.setdefault(ses.year, set()).add(ses.code.lower())
         for server in self.servers:
             if server.connected:
-                files = server.listdir(os.path.join(server.root, self.aux_folder, ses.year, ses.code.lower()))[-1]
-                for code in self.file_codes:
-                    if ses.file_path(code).name in files:
-                        return
-        self.add_missing(ses)
+                for year, codes in years.items():
+                    root = os.path.join(server.root, self.aux_folder, year)
+                    # Folder names from http listings could end with /
+                    folders = {os.path.basename(name.rstrip('/')) for name in server.listdir(root)[0]}
+                    for folder in codes.intersection(folders):
+                        names.update(name for name, *_ in server.listdir(os.path.join(root, folder))[-1])
+        return names
 
     # Check for missing schedules
     def check_schedules(self, max_days):
@@ -147,16 +151,23 @@ class CheckSkd(Worker):
         def t2s(t):
             return t.strftime('%Y-%m-%d 00:00:00')  # function to format time
 
-        self.connect_servers()  # Connect to all data centers
         today, later = t2s(now), t2s(now + timedelta(days=max_days+1))
         url, tunnel = app.get_dbase_info()
         with IVSdata(url, tunnel) as dbase:
-            for nbr, ses_id in enumerate(dbase.get_sessions(today, later, self.schedule_types), 1):
-                self.check_session(dbase.get_session(ses_id))
-        self.disconnect_servers()  # Close connection to data centers
+            sessions = dbase.get_session_list(today, later, self.schedule_types)
+            # Sessions with schedule in our session folder
+            waiting = [ses for ses in sessions if not any(ses.file_path(code).exists() for code in self.file_codes)]
+            if waiting:
+                self.connect_servers()  # Connect to all data centers
+                available = self.list_aux_files(waiting)
+                self.disconnect_servers()  # Close connection to data centers
+                # Check if skd or vex on any IVS data center
+                for ses in waiting:
+                    if available.isdisjoint(ses.file_path(code).name for code in self.file_codes):
+                        self.add_missing(ses)
 
         nbr_missing = self.send_daily_messages()
-        self.stop(f'checked {nbr:d} schedules and {nbr_missing:d} are missing')
+        self.stop(f'checked {len(sessions):d} schedules and {nbr_missing:d} are missing')
 
     # Process message from queue
     def process_msg(self, ch, method, properties, body):
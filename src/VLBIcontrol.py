@@ -4,8 +4,8 @@ import traceback
 import os
 
 from utils import app
-from utils.files import is_master, get_md5sum, remove, chmod
-from utils.servers import load_servers, get_server, get_centers, DATACENTER
+from utils.files import is_master, remove, chmod, DigestCache
+from utils.servers import load_servers, ServerPool, DATACENTER, NOT_MODIFIED
 from rmq import Worker
 from ivsdb import IVSdata, loaders
 
@@ -16,33 +16,49 @@ class ControlFile(Worker):
         super().__init__()
 
         self.failures = {}
+        # Cache of md5 and remote fingerprints of control files
+        self.digests = DigestCache(app.Applications.VLBI.get('control_digests', '~/.control-digests.sqlite3'))
+        # Connections to data centers and database are kept between messages
+        self.servers = ServerPool()
+        self.dbase = None
 
         # Set start time as now
         self.set_start_time('now')
 
-    # Update database (MySQL) with new file
-    def update_database(self, dbase, name, path, timestamp):
+    # Update database (MySQL) with new file. Loaders use diff (removed and added lines) if available.
+    # Return False if file could not be loaded.
+    def update_database(self, dbase, name, path, timestamp, diff=None):
 
         try:
             if is_master(name):
-                success = loaders.load_master(dbase, path)
+                success = loaders.load_master(dbase, path, diff)
             elif name == 'ns-codes.txt':
-                success = loaders.load_ns_codes(dbase, path)
+                success = loaders.load_ns_codes(dbase, path, diff)
             elif name == 'master-format.txt':
-                success = loaders.load_master_format(dbase, path)
+                success = loaders.load_master_format(dbase, path, diff)
             else:  # Probably master notes
                 if timestamp:
                     dbase.update_recent_file(name, timestamp)
                 self.notify(f'{name} downloaded! Need to check impact on IVSCC database', wait=False)
-                return
+                return True
             if success and timestamp:
                 dbase.update_recent_file(name, timestamp)
             self.info(f'updating database with {name} {"was successful" if success else "failed"}')
+            return success
         except Exception as err:
             if not timestamp or timestamp > self.failures.get(name, 0):
                 self.notify(f'Error reading {name}\n{str(err)}\n{traceback.format_exc()}', wait=False)
                 if timestamp:
                     self.failures[name] = timestamp
+            return False
+
+    # Open database once. Engine is using pre_ping to test connection before each use.
+    def get_dbase(self):
+        if not self.dbase:
+            url, tunnel = app.get_dbase_info()
+            self.dbase = IVSdata(url, tunnel)
+            self.dbase.open()
+        return self.dbase
 
     # Process message sent by scanners
     def process_file(self, center, name, rpath, timestamp):
@@ -51,37 +67,48 @@ class ControlFile(Worker):
         # Load DataCenter configurations
         center = center if center in load_servers(DATACENTER) else 'cddis'
 
-        # Download in tmp folder with random name
+        # Download in tmp folder with random name. File is not downloaded if remote fingerprint has not changed.
+        lpath = os.path.join(app.VLBIfolders.control, name)
         tpath = os.path.join((tmp_folder := mkdtemp()), name)
-        with get_server(DATACENTER, center) as server:
+        fingerprint = self.digests.remote(lpath) if timestamp.isdigit() else None
+        with self.servers.connection(DATACENTER, center) as server:
             rpath = os.path.join(server.root, rpath)
-            ok, info = server.download(rpath, tpath)
-        if not ok:
-            self.critical(f'could not download {name}. [{info}')
-            return
-        url, tunnel = app.get_dbase_info()
-        with IVSdata(url, tunnel) as dbase:
-            if not timestamp.isdigit():  # Process but do not save
+            ok, info, remote = server.conditional_download(rpath, tpath, fingerprint)
+        dbase = self.get_dbase()
+        try:
+            if info == NOT_MODIFIED:  # Same file on server
+                dbase.update_recent_file(name, timestamp)
+            elif not ok:
+                self.critical(f'could not download {name}. [{info}')
+            elif not timestamp.isdigit():  # Process but do not save
                 self.update_database(dbase, name, tpath, None)
-            else:  # Process if new file
-                lpath = os.path.join(app.VLBIfolders.control, name)
-                if os.path.exists(lpath) and get_md5sum(lpath) == info:  # Same file on server
-                    dbase.update_recent_file(name, timestamp)
-                else:  # New file
-                    self.update_database(dbase, name, tpath, int(timestamp))
-                    shutil.move(tpath, lpath)  # Update file in control folder
-                    chmod(lpath)
-                    if is_master(name):
-                        ans, err = app.exec_and_wait(f'update_vdb_master {lpath}')
-                        if err:
-                            self.notify(f'update_vdb_master {lpath} failed\n{ans}\n{err}')
-        shutil.rmtree(tmp_folder)
+            elif os.path.exists(lpath) and self.digests.md5(lpath) == info:  # Same file on server
+                dbase.update_recent_file(name, timestamp)
+                self.digests.set(lpath, info, remote)
+            # New file. Local copy is kept if load failed so that next diff still includes these changes.
+            elif self.update_database(dbase, name, tpath, int(timestamp), loaders.diff_lines(lpath, tpath)):
+                shutil.move(tpath, lpath)  # Update file in control folder
+                chmod(lpath)
+                self.digests.set(lpath, info, remote)
+                if is_master(name):
+                    ans, err = app.exec_and_wait(f'update_vdb_master {lpath}')
+                    if err:
+                        self.notify(f'update_vdb_master {lpath} failed\n{ans}\n{err}')
+        finally:
+            dbase.orm_ses.remove()  # Do not keep records between messages
+            shutil.rmtree(tmp_folder)
+
+    # Close idle connections to data centers
+    def process_timeout(self):
+        self.servers.clean()
+        super().process_timeout()
 
     # Process message from rmq queue
     def process_msg(self, ch, method, properties, body):
         try:
             center, name, rpath, timestamp = body.decode('utf-8').strip().split(',', 3)
             self.process_file(center, name, rpath, timestamp)
+            self.servers.clean()
         except Exception as err:
             self.notify(f'problem {body.decode()}\n{str(err)}\n{traceback.format_exc()}')
 
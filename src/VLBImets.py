@@ -78,8 +78,7 @@ class MetScanner(Worker):
         start, end = t2s(now - timedelta(days=days)), t2s(now)
         url, tunnel = app.get_dbase_info()
         with IVSdata(url, tunnel) as dbase:
-            for ses_id in dbase.get_sessions(start, end, ['standard', 'intensive', 'vgos']):
-                session = dbase.get_session(ses_id)
+            for session in dbase.get_session_list(start, end, ['standard', 'intensive', 'vgos']):
                 for sta_id in stations:
                     if sta_id in session.stations:
                         for nbr in range(2):
@@ -1,13 +1,82 @@
 import os
+import sqlite3
 import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from rmq import Worker
 from utils import app
-from utils.servers import get_server, load_servers, DATACENTER
+from utils.servers import get_server, load_servers, get_config_item, DATACENTER
 from tools import record_submitted_files
 from ivsdb.models import UploadedFile
 
 
+# State of each file waiting in failed_upload folder (sqlite database). State is saved after each step so that
+# uploads could be resumed after a crash.
+# pending -> uploaded (data center accepted file) -> recorded (in uploaded_files table) -> removed
+# Failed uploads are tried again after a delay doubling after each try, up to MaxTries.
+class UploadState:
+    MaxTries, Delay = 6, 300
+
+    def __init__(self, path):
+        self.con = sqlite3.connect(os.path.expanduser(path), timeout=30)
+        self.con.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                         "status TEXT, tries INTEGER, updated TEXT)")
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    # Add new files and reset files replaced since last try, whatever their status. Remove records of files not in
+    # folder.
+    def sync(self, files):
+        known = {name: (size, mtime) for name, size, mtime in self.con.execute("SELECT name, size, mtime FROM files")}
+        for name, path in files.items():
+            info = os.stat(path)
+            if known.pop(name, None) != (info.st_size, info.st_mtime):
+                self.con.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, 'pending', 0, ?)",
+                                 (name, info.st_size, info.st_mtime, datetime.now().isoformat()))
+        self.con.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in known])
+        self.con.commit()
+
+    # Get names of files with this status
+    def get(self, status):
+        return [row[0] for row in self.con.execute("SELECT name FROM files WHERE status = ? ORDER BY name", (status,))]
+
+    # Get names of pending files that could be uploaded now. Files failing too often are not tried until replaced.
+    def get_ready(self, now=None):
+        now, ready = now if now else datetime.now(), []
+        for name, tries, updated in self.con.execute("SELECT name, tries, updated FROM files WHERE status = 'pending' "
+                                                     "AND tries < ? ORDER BY name", (self.MaxTries,)):
+            if not tries or now - datetime.fromisoformat(updated) >= timedelta(seconds=self.Delay * 2 ** (tries - 1)):
+                ready.append(name)
+        return ready
+
+    def set(self, name, status):
+        self.con.execute("UPDATE files SET status = ?, updated = ? WHERE name = ?",
+                         (status, datetime.now().isoformat(), name))
+        self.con.commit()
+
+    # Keep track of failed tries. Return True if file will not be tried again.
+    def failed(self, name):
+        self.con.execute("UPDATE files SET tries = tries + 1, updated = ? WHERE name = ?",
+                         (datetime.now().isoformat(), name))
+        self.con.commit()
+        row = self.con.execute("SELECT tries FROM files WHERE name = ?", (name,)).fetchone()
+        return bool(row) and row[0] >= self.MaxTries
+
+    def remove(self, name):
+        self.con.execute("DELETE FROM files WHERE name = ?", (name,))
+        self.con.commit()
+
+
+# Upload group of files with one login. Executed by thread of upload pool with its own server instance.
+# Return names of uploaded files.
+def upload_files(center, paths):
+    server = get_server(DATACENTER, center)
+    return set(server.upload(paths))
+
+
 # ADAP application to upload files to cddis
 class Uploader(Worker):
 
@@ -15,6 +84,7 @@ class Uploader(Worker):
         super().__init__()
 
         self.exclusive_queue = True # Create an exclusive queue that will delete when finished.
+        self.state = UploadState(app.Applications.VLBI.get('upload_state', '~/.upload-state.sqlite3'))
         self.set_start_time(app.args.start, app.args.period, reset_timeout = False)
 
     # Process message in queue
@@ -39,16 +109,46 @@ class Uploader(Worker):
         if not (files := {name: path for name, path in [(name, os.path.join(folder, name))
                                                         for name in os.listdir(folder)] if os.path.isfile(path)}):
             return  # No files to upload
-        # Upload to data center
-        server = get_server(DATACENTER, center)
-        # Check if hostname is production
-        submitted = []
-        for name in server.upload(list(files.values())):
-            if name in files:
-                os.remove(files[name])
-                submitted.append(UploadedFile(name, 'oper', 'uploader', 'ok'))
-        record_submitted_files(submitted)
+        self.state.sync(files)
+        self.resume(files)
+        if not (pending := self.state.get_ready()):
+            return
+        # Upload pending files to data center. Files are split in groups so that each thread logs in once.
+        workers = max(1, min(len(pending), get_config_item(DATACENTER, center, 'max_uploads', 4)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            uploads = {pool.submit(upload_files, center, [files[name] for name in group]): group
+                       for group in [pending[index::workers] for index in range(workers)]}
+            for future in as_completed(uploads):
+                try:
+                    uploaded = future.result()
+                except Exception as err:
+                    uploaded = set()
+                    self.warning(f'upload to {center} failed [{str(err)}]')
+                for name in uploads[future]:
+                    if name in uploaded:
+                        self.state.set(name, 'uploaded')
+                        self.record(name)
+                        self.remove(name, files[name])
+                    elif self.state.failed(name):
+                        self.notify(f'Could not upload {name} to {center} after {self.state.MaxTries} tries')
+
+    # Finish files uploaded or recorded before a crash
+    def resume(self, files):
+        for name in self.state.get('uploaded'):
+            self.record(name)
+        for name in self.state.get('recorded'):
+            self.remove(name, files[name])
+
+    # Record uploaded file in database
+    def record(self, name):
+        record_submitted_files([UploadedFile(name, 'oper', 'uploader', 'ok')])
+        self.state.set(name, 'recorded')
 
+    # Remove uploaded file from folder
+    def remove(self, name, path):
+        if os.path.exists(path):
+            os.remove(path)
+        self.state.remove(name)
 
 if __name__ == '__main__':
     import argparse
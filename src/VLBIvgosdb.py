@@ -30,6 +30,12 @@ class VGOSdbWorker(Worker):
                     dbase.update_recent_file(name, timestamp, tableId=1)
         except Exception as e:
             self.notify('[{}]\n{}'.format(body.decode('utf-8'), str(e)))
+        self.vgosdb.servers.clean()
+
+    # Close idle connections to correlators
+    def process_timeout(self):
+        self.vgosdb.servers.clean()
+        super().process_timeout()
 
 
 if __name__ == '__main__':
@@ -1,6 +1,8 @@
 import os
 import shutil
+import tempfile
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from importlib import import_module
 from datetime import datetime
 from pathlib import Path
@@ -296,6 +298,12 @@ class APS:
                     logger.error(line)
             return False, f'Could not create analysis report {str(err)}. See log.'
 
+    # Make analysis report using comments saved in processing history
+    def make_report_from_history(self):
+        is_ivs = self.processing.check_agency()
+        comments = [self.processing.Comments.get(key, []) for key in ('Problems', 'Parameterization', 'Other')]
+        return self.make_analysis_report(is_ivs, *comments)
+
     # Send email to IVS analysis group
     def send_analyst_email(self, name='last'):
 
@@ -338,6 +346,9 @@ class APS:
             # Save error and return failed
             self.add_error(prc.errors)
             return False
+        except TimeoutError as err:  # Solve or global file locked by another process
+            self.add_error(str(err))
+            return False
         except Exception as err:
             self.add_error('Unexpected error! Contact Mario\n{}\n{}'.format(str(err), traceback.format_exc()))
             return False
@@ -396,3 +407,40 @@ def get_aps_process():
             if len(prc.info['cmdline']) > 3 and prc.info['cmdline'][1].endswith('/aps'):
                 yield prc.info['pid'], prc.info['cmdline'][-1]
 
+
+# Regenerate analysis report of one session and write it in folder. Report is written in temporary file
+# and renamed so that an existing report is never partially written. Return error message or None.
+def write_report(ses_id, folder):
+    try:
+        aps = APS(ses_id)
+        if not aps.is_valid:
+            return aps.errors or f'{ses_id} invalid'
+        if not aps.spool:
+            return f'No valid spool file for {aps.ses_id} {aps.db_name}'
+        ok, text = aps.make_report_from_history()
+        if not ok:
+            return text
+        ac = 'IVS' if aps.processing.check_agency() else aps.ac_code.upper()
+        path = os.path.join(folder, f'{aps.ses_id}-{ac}-analysis-report.txt')
+        with tempfile.NamedTemporaryFile('w', dir=folder, prefix=f'.{aps.ses_id}-', delete=False) as tmp:
+            tmp.write(text)
+        os.replace(tmp.name, path)
+        chmod(path)
+        return None
+    except Exception as err:
+        return f'Unexpected error {str(err)}\n{traceback.format_exc()}'
+
+
+# Regenerate analysis reports of many sessions using a pool of processes. Each process reads the spool,
+# schedule and vgosDB of its session only once. Return dictionary of errors for sessions that failed.
+def write_reports(sessions, folder, workers=None):
+    os.makedirs(folder, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers if workers else os.cpu_count()) as pool:
+        jobs, errors = {pool.submit(write_report, ses_id, folder): ses_id for ses_id in sessions}, {}
+        for job in as_completed(jobs):
+            try:
+                if err := job.result():
+                    errors[jobs[job]] = err
+            except Exception as exc:  # Worker died (BrokenProcessPool) or job could not be pickled
+                errors[jobs[job]] = f'Process failed {type(exc).__name__} {str(exc)}'
+        return errors
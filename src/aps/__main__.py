@@ -5,6 +5,7 @@ import sys
 import signal
 import logging
 import select
+import time
 from pathlib import Path
 
 from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox, QWidget, QStyle, QFileDialog
@@ -438,11 +439,7 @@ def print_report(arguments):
     if not aps.spool:
         print(f'No valid spool file for {aps.ses_id} {aps.db_name}')
         return
-    is_ivs = aps.processing.check_agency()
-    problems = aps.processing.Comments.get('Problems', [])
-    parameterization = aps.processing.Comments.get('Parameterization', [])
-    other = aps.processing.Comments.get('Other', [])
-    ok, txt = aps.make_analysis_report(is_ivs, problems, parameterization, other)
+    ok, txt = aps.make_report_from_history()
     print(txt if ok else aps.errors)
 
 
@@ -469,6 +466,7 @@ def batch_submit(arguments):
                         aps.clear_errors()
                     else:
                         aps.processing.done(f'SUBMIT-{code}')
+            aps.processing.save()
 
 
 def batch_proc(arguments):
@@ -496,6 +494,76 @@ def batch_proc(arguments):
                     else:
                         print(aps.errors)
                         break
+            aps.processing.save()
+
+
+# Create VMF TOTAL and DRY files for many sessions. VMF applications are running in parallel.
+def batch_vmf(arguments):
+    from aps.vmf import VMF
+
+    initials, sessions = arguments.vmf[0], arguments.vmf[1:]
+    if not APS.validate_initials(initials):
+        print(f'No valid initials in --vmf option {arguments.vmf}')
+        return
+    if select.select([sys.stdin], [], [], 0)[0]:
+        sessions = list(filter(None, [name.strip() for name in sys.stdin.readlines()]))
+
+    # Group sessions using same opa configuration file
+    groups = {}
+    for ses_id in sessions:
+        aps = APS(ses_id)
+        if not aps.is_valid:
+            print(aps.errors)
+        else:
+            groups.setdefault(aps.opa_lcl, []).append(aps)
+
+    for opa_lcl, apss in groups.items():
+        vmf = VMF(opa_lcl, initials)
+        if vmf.has_errors:
+            print(vmf.errors)
+            continue
+        errors = vmf.execute_batch([aps.vgosdb for aps in apss], arguments.workers)
+        for aps in apss:
+            if errors[aps.vgosdb.name]:
+                print(aps.ses_id, '\n'.join(errors[aps.vgosdb.name]))
+            else:
+                aps.processing.done('VMF')
+                aps.processing.save()
+
+
+# Insert records of many sessions, read from files of EOP records, in one EOP series file with only one rewrite
+def batch_eop(arguments):
+    from aps.eop import EOP, read_sessions
+
+    code, paths = arguments.eop[0], arguments.eop[1:]
+    eop = EOP(arguments.opa_config if arguments.opa_config else app.Applications.APS['standard'], '--')
+    if eop.has_errors:
+        print(eop.errors)
+        return
+    if not (global_file := eop.get_opa_path(code)):
+        print(f'No file for {code} in {eop.OPA_CONFIG}')
+        return
+    sessions = read_sessions(paths)
+    if eop.insert_sessions(global_file, sessions):
+        print(f'{len(sessions)} sessions inserted in {global_file}')
+    else:
+        print(eop.errors)
+
+
+# Regenerate analysis reports for many sessions in parallel. Elapsed time is printed for benchmarking.
+def batch_reports(arguments):
+    from aps import write_reports
+
+    folder, sessions = arguments.reports[0], arguments.reports[1:]
+    if select.select([sys.stdin], [], [], 0)[0]:
+        sessions = list(filter(None, [name.strip() for name in sys.stdin.readlines()]))
+
+    start = time.time()
+    errors = write_reports(sessions, folder, arguments.workers)
+    for ses_id, err in errors.items():
+        print(ses_id, err)
+    print(f'{len(sessions) - len(errors)} of {len(sessions)} reports written in {folder} '
+          f'in {time.time() - start:.1f} seconds')
 
 
 if __name__ == '__main__':
@@ -512,6 +580,13 @@ if __name__ == '__main__':
     parser.add_argument('-old', '--old_naming', help='use old naming convention', action='store_true', required=False)
     parser.add_argument('-e', '--email_report', help='', required=False)
     parser.add_argument('-b', '--batch', help='procedure to execute in batch mode', nargs='+', required=False)
+    parser.add_argument('-V', '--vmf', help='initials and sessions for VMF in batch mode', nargs='+', required=False)
+    parser.add_argument('-E', '--eop', help='opa code of EOP series file and files of records to insert', nargs='+',
+                        required=False)
+    parser.add_argument('-R', '--reports', help='folder and sessions for analysis reports in batch mode', nargs='+',
+                        required=False)
+    parser.add_argument('-w', '--workers', help='number of VMF or report processes', type=int, default=0,
+                        required=False)
     parser.add_argument('-S', '--submit', help='procedure to execute in batch mode', nargs='+', required=False)
     parser.add_argument('-editor', help='', action='store_true', required=False)
     parser.add_argument('-notes', help='', action='store_true', required=False)
@@ -530,6 +605,12 @@ if __name__ == '__main__':
             batch_proc(args)
         elif args.submit:
             batch_submit(args)
+        elif args.vmf:
+            batch_vmf(args)
+        elif args.reports:
+            batch_reports(args)
+        elif args.eop:
+            batch_eop(args)
         else:
             qaps = QAPS(args.param)
             qaps.exec()
@@ -1,8 +1,149 @@
+import os
+import json
+from bisect import bisect_left, bisect_right
 from datetime import datetime
 
 from utils import app
 from ivsdb import IVSdata
 from aps.process import APSprocess
+from aps.global_file import file_digest, GlobalLock, CHUNK
+
+
+# Make the key used to sort records in EOP series file
+def make_key(string):
+    mjd, _, ses_id, *_ = string[1:].split()
+    return f'{mjd}-{ses_id}'
+
+
+# Format record as written in EOP series file
+def format_record(record):
+    mjd, vgosdb, session, data = record[1:].split(maxsplit=3)
+    return f'{record[0]} {mjd} {vgosdb.replace("$", ""):<22s} {session:<12s} {data}'
+
+
+# Read EOP records from files and group them by session. Comment lines are ignored.
+def read_sessions(paths):
+    sessions = {}
+    for path in paths:
+        with open(path, errors='ignore') as f:
+            for line in f:
+                if (line := line.rstrip()) and not line.startswith('#'):
+                    sessions.setdefault(line[1:].split()[2], []).append(line)
+    return list(sessions.values())
+
+
+# Index of sorted records in EOP series file. Saved in sidecar file and validated using size and digests.
+class EOPindex:
+
+    def __init__(self, path):
+        self.path, self.idx_path = path, f'{path}.idx'
+        self.keys, self.offsets, self.analysis = [], [], []
+        self.size, self.data_end, self.is_sorted = 0, 0, True
+
+        if not self.load():
+            self.build()
+            self.save()
+
+    # Load index from sidecar file. Return False if it does not exist or not valid for current file
+    def load(self):
+        try:
+            with open(self.idx_path) as f:
+                info = json.load(f)
+            if info['size'] != (size := os.path.getsize(self.path)) or info['digest'] != file_digest(self.path, size):
+                return False
+            self.keys, self.offsets, self.analysis = info['keys'], info['offsets'], info['analysis']
+            self.size, self.data_end, self.is_sorted = info['size'], info['data_end'], True
+            return True
+        except (IOError, ValueError, KeyError):
+            return False
+
+    # Save index for path (current global file or new temporary file)
+    def save(self, path=None):
+        path = path if path else self.path
+        if not self.is_sorted:
+            return
+        try:
+            with open(self.idx_path, 'w') as f:
+                json.dump(dict(size=self.size, digest=file_digest(path, self.size), data_end=self.data_end,
+                               analysis=self.analysis, keys=self.keys, offsets=self.offsets), f)
+        except IOError:
+            pass  # Index will be rebuilt next time
+
+    # Read EOP series file and build index
+    def build(self):
+        self.keys, self.offsets, self.analysis = [], [], []
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                line = raw.decode('utf-8', errors='ignore')
+                if line.startswith('#'):
+                    if line.startswith('# Analysis'):
+                        self.analysis.append(offset + len(raw))
+                elif line.strip():
+                    key = make_key(line)
+                    if self.keys and key < self.keys[-1]:
+                        self.is_sorted = False
+                    self.keys.append(key)
+                    self.offsets.append(offset)
+                    self.data_end = offset + len(raw)
+                offset += len(raw)
+        self.size = offset
+
+    # Find byte range of records with this key. Range is empty if key is not in file.
+    def find(self, key):
+        lo, hi, nbr = bisect_left(self.keys, key), bisect_right(self.keys, key), len(self.keys)
+        start = self.offsets[lo] if lo < nbr else self.size
+        end = self.offsets[hi] if hi < nbr else (self.data_end if lo < nbr else self.size)
+        return start, end
+
+    # Write new file with header line added after '# Analysis' lines and sessions records replacing old ones.
+    # Unchanged parts of the file are copied by blocks.
+    def splice(self, tpath, sessions, header):
+        edits = [(offset, offset, [header], True) for offset in self.analysis]
+        for records in sorted(sessions, key=lambda recs: make_key(recs[0])):
+            edits.append((*self.find(make_key(records[0])), [format_record(record) for record in records], False))
+        edits.sort(key=lambda edit: edit[:2])
+
+        keys, offsets, analysis, index, data_end, last_byte = [], [], [], 0, 0, b'\n'
+        with open(self.path, 'rb') as src, open(tpath, 'wb') as out:
+            # Copy block and update offsets of records in block
+            def copy(start, end):
+                nonlocal index, data_end, last_byte
+                shift = out.tell() - start
+                while index < len(self.keys) and self.offsets[index] < end:
+                    keys.append(self.keys[index])
+                    offsets.append(self.offsets[index] + shift)
+                    index += 1
+                if start < self.data_end <= end:
+                    data_end = self.data_end + shift
+                src.seek(start)
+                while (remaining := end - src.tell()) > 0 and (chunk := src.read(min(remaining, CHUNK))):
+                    out.write(chunk)
+                    last_byte = chunk[-1:]
+
+            position = 0
+            for start, end, lines, is_header in edits:
+                copy(position, start)
+                # Skip records that are replaced
+                while index < len(self.keys) and self.offsets[index] < end:
+                    index += 1
+                if last_byte != b'\n':  # Copied text did not end with end of line (last line of file)
+                    out.write(b'\n')
+                    last_byte = b'\n'
+                if is_header:
+                    analysis.append(out.tell())
+                for line in lines:
+                    if not is_header:
+                        keys.append(make_key(line))
+                        offsets.append(out.tell())
+                    out.write(f'{line}\n'.encode('utf-8'))
+                    data_end = out.tell() if not is_header else data_end
+                position = max(position, end)
+            copy(position, self.size)
+            size = out.tell()
+
+        self.keys, self.offsets, self.analysis, self.size, self.data_end = keys, offsets, analysis, size, data_end
+        self.save(tpath)
 
 
 # Class use to update EOP solutions
@@ -18,44 +159,51 @@ class EOP(APSprocess):
 
         self.check_required_files(['GEN_INPERP', 'EOPS_CNT'])
 
-    def update_eop_file(self, tpath, global_file, records):
+    # Insert records of many sessions in EOP series file and replace global file. File is locked during update.
+    def insert_sessions(self, global_file, sessions):
+        prefix, suffix = os.path.splitext(os.path.basename(global_file))
+        tpath = self.get_tmp_file(prefix + '_', suffix)
+        with GlobalLock(global_file):
+            self.update_eop_file_bulk(tpath, global_file, sessions)
+            return self.update_global_file(tpath, global_file)
 
-        def make_key(string):
-            mjd, _, ses_id, *_ = string[1:].split()
-            return f'{mjd}-{ses_id}'
+    # Insert records of many sessions into EOP series file with only one rewrite
+    def update_eop_file_bulk(self, tpath, global_file, sessions):
+        now = datetime.now().strftime('%Y.%m.%d-%H:%M:%S')
+        header = f'# Updated by APS at      {now}  by user {self.real_user}'
+        index = EOPindex(global_file)
+        if index.is_sorted:
+            index.splice(tpath, sessions, header)
+        else:  # Cannot use binary search. Read file line by line.
+            self.rewrite_eop_file(tpath, global_file, sessions, header)
+
+    # Insert records by reading all lines of EOP series file
+    @staticmethod
+    def rewrite_eop_file(tpath, global_file, sessions, header):
 
         def insert_record(lines, file):
             for record in lines:
-                mjd, vgosdb, session, data = record[1:].split(maxsplit=3)
-                print(f'{record[0]} {mjd} {vgosdb.replace("$", ""):<22s} {session:<12s} {data}', file=file)
+                print(format_record(record), file=file)
 
-        # Insert new records into file
-        db_key = make_key(records[0])
-        inserted = False
+        sessions = {make_key(records[0]): records for records in sessions}
+        pending = sorted(sessions.keys())
         with open(tpath, 'w') as tmp, open(global_file, errors='ignore') as glb:
             for line in glb:
                 line = line.rstrip()
                 if line.startswith('#'):
                     print(line, file=tmp)
                     if line.startswith('# Analysis'):
-                        now = datetime.now().strftime('%Y.%m.%d-%H:%M:%S')
-                        print(f'# Updated by APS at      {now}  by user {self.real_user}', file=tmp)
+                        print(header, file=tmp)
                 elif line.strip():  # Not empty
                     key = make_key(line)
-                    if key < db_key:
-                        insert_record([line], tmp)
-                    elif key == db_key:
-                        if not inserted:
-                            insert_record(records, tmp)
-                            inserted = True
-                    elif key > db_key:
-                        if not inserted:
-                            insert_record(records, tmp)
+                    # Insert records of sessions with key smaller or equal to this line
+                    while pending and pending[0] <= key:
+                        insert_record(sessions[pending.pop(0)], tmp)
+                    if key not in sessions:  # Old records for these sessions are replaced
                         insert_record([line], tmp)
-                        inserted = True
             # Insert at end of file
-            if not inserted:
-                insert_record(records, tmp)
+            for db_key in pending:
+                insert_record(sessions[db_key], tmp)
 
     def eopkal(self, eopb, vgosdb):
         # Make temp files
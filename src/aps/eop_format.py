@@ -6,15 +6,38 @@ from pandas._libs.tslibs.parsing import DateParseError
 import datetime as dt
 from datetime import timedelta
 
+import os
+from functools import lru_cache
+from io import StringIO
 from difflib import SequenceMatcher
 
+CHUNK = 10000  # Number of data lines formatted and written at once
+
+
+# Key used to cache information read from file. Cache is not used if file is modified.
+def file_key(fname):
+    return os.path.abspath(fname), os.stat(fname).st_mtime
+
+
+# Read csv template once and keep rows (name, message, fmt)
+@lru_cache(maxsize=None)
+def read_template(key):
+    df = read_csv(key[0])
+    return tuple(zip(df.name, df.message, df.fmt))
+
+
+# Read control file once
+@lru_cache(maxsize=None)
+def read_control(key):
+    return control_to_dict(key[0])
+
 
 def control_to_dict(control_fname):
     # note that this function does not handle
     # line continuation \ in control files correctly
     # this needs to be implemented
     cont_dict = {}
-    section = None
+    section, var, continue_flag = None, None, False
     with open(control_fname, 'r') as rfile:
         for line in rfile:
             line = line.split('*')[0]
@@ -53,7 +76,7 @@ class EOP_format:
 
         description_fname = kwargs.get('description_fname')
         control_fname = kwargs.get('control_fname')
-        self.control_dict = control_to_dict(control_fname)
+        self.control_dict = read_control(file_key(control_fname))
         self.description = Block('HEADER',
                                  description_fname)
 
@@ -61,8 +84,7 @@ class EOP_format:
         data_col_names = kwargs.get('data_col_names')
         self.data = DataBlock(data_fname,
                               data_col_names)
-        self.text = ''
-        self.make_text()
+        self.update_dynamic_fields()
 
     def update_dynamic_fields(self):
         header = self.header
@@ -88,12 +110,22 @@ class EOP_format:
         header.execute_formats()
         description.execute_formats()
 
-    def make_text(self):
-        self.update_dynamic_fields()
-        text = [ self.header.begin() + self.description.insert()
-        text += self.data.insert()
-        text += self.header.end()
-        self.text = ''.join(text)
+    # Stream file to opened output. Data lines are never all in memory.
+    def write(self, out):
+        out.write(self.header.begin() + self.description.insert())
+        self.data.write(out)
+        out.write(self.header.end())
+
+    # Write EOP file
+    def save(self, path):
+        with open(path, 'w') as out:
+            self.write(out)
+
+    @property
+    def text(self):
+        out = StringIO()
+        self.write(out)
+        return out.getvalue()
 
 
 class SubField:
@@ -154,53 +186,63 @@ class SubField:
 
 class DataBlock:
     def __init__(self, data_fname, col_names_fname):
-        self.data = ''
+        self.data_fname = data_fname
         self.first_date = None
         self.last_date = None
         self.obs_names = []
         self.obs_units = {}
-        with open(data_fname, 'r') as rfile:
-            counter = 0
-            for line in rfile:
-                if line[0] == '#' or line == '\n':
-                    continue
-                if self.first_date is None:
-                    self.first_date = line.split()[0]
-                counter += 1
-                if counter == 10 and True:
-                    break
-                line_write = line.replace("-0 ", "NA ")
-                self.data += line_write
-            self.last_line = line_write.split()
-            self.last_date = self.last_line[0]
-            self.number_of_entries = counter
+        # Scan file to get first and last dates and number of entries
+        counter, last = 0, None
+        for line in self.read_lines():
+            if self.first_date is None:
+                self.first_date = line.split()[0]
+            counter, last = counter + 1, line
+        self.last_line = self.format_lines(last).split()
+        self.last_date = self.last_line[0]
+        self.number_of_entries = counter
 
-        print(self.data)
         with open(col_names_fname, 'r') as rfile:
             lines = rfile.readlines()
             self.col_names = lines[0].split()
             self.col_units = lines[1].split()
 
         obs_ind = list(range(1, 6)) + list(range(19, 24))  # indices of observables
-        print(self.last_line)
         for i in obs_ind:
-            print(self.last_line[i])
             if self.last_line[i] != 'NA':
                 self.obs_names.append(self.col_names[i])
                 self.obs_units[self.col_names[i]] = self.col_units[i]
-                print('OBS', self.col_names[i], self.obs_names[-1], self.obs_units[self.col_names[i]])
-
-        #        self.obs_names = [self.col_names[i] for i in obs_ind]
-        #        self.obs_units = [self.col_units[i] for i in obs_ind]
 
         self.first_date = self.julian_to_dt(self.first_date)
         self.last_date = self.julian_to_dt(self.last_date)
 
+    # Read data lines. Comments and empty lines are skipped.
+    def read_lines(self):
+        with open(self.data_fname, 'r') as rfile:
+            for line in rfile:
+                if line[0] != '#' and line != '\n':
+                    yield line
+
+    # Format many lines in one operation (missing values are NA)
+    @staticmethod
+    def format_lines(text):
+        return text.replace("-0 ", "NA ")
+
+    # Write data block by chunks of lines
+    def write(self, out):
+        out.write('+DATA\n')
+        lines = []
+        for line in self.read_lines():
+            lines.append(line)
+            if len(lines) == CHUNK:
+                out.write(self.format_lines(''.join(lines)))
+                lines = []
+        out.write(self.format_lines(''.join(lines)))
+        out.write('-DATA\n')
+
     def insert(self):
-        text = '+DATA\n'
-        text += self.data
-        text += '-DATA\n'
-        return text
+        out = StringIO()
+        self.write(out)
+        return out.getvalue()
 
     def julian_to_dt(self, jtime):
         # converts jtime float into normal datetime format
@@ -216,21 +258,15 @@ class DataBlock:
 
 class Block:
     def __init__(self, block_name, csv_fname, header=False):
-        df = read_csv(csv_fname)
-        self.df = df
-        self.fields = [Field(name, message=message) for name, message in zip(df.name, df.message)]
+        # Template is read once. Fields are new objects since they are modified.
+        self.rows = read_template(file_key(csv_fname))
+        self.fields = [SubField(name, message) if fmt == 'array' else Field(name, message=message)
+                       for name, message, fmt in self.rows]
         self.csv_fname = csv_fname
-        self._field_dict = {name: field for name, field in zip(df.name, self.fields)}
+        self._field_dict = {field.name: field for field in self.fields}
         self.header = header
         self.block_name = block_name
 
-        # handle subfields
-        is_subfield = (self.df.fmt == 'array')
-        subfield_idx = df[is_subfield].index.values
-
-        for i in subfield_idx:
-            self.fields[i] = SubField(self.fields[i].name, self.fields[i].message)
-
     def update_field(self, field_name, msg):
 
         for field in self.fields:
@@ -305,7 +341,7 @@ class Block:
         return text
 
     def execute_formats(self):
-        raw_formats = self.df.fmt
+        raw_formats = [fmt for _, _, fmt in self.rows]
         formatted_message = ''
         for field, fmt in zip(self.fields, raw_formats):
 
@@ -374,13 +410,14 @@ class Field:
         return f'Field({self.name},{self.message})'
 
 
-eop_24 = EOP_format(description_fname='description_24_new.csv',
-                    control_fname="2023a_24h_eop.cnt",
-                    data_fname='2023a_24h_last.eops',
-                    data_col_names='data_col_names',
-                    )
+if __name__ == '__main__':
+    eop_24 = EOP_format(description_fname='description_24_new.csv',
+                        control_fname="2023a_24h_eop.cnt",
+                        data_fname='2023a_24h_last.eops',
+                        data_col_names='data_col_names',
+                        )
 
-print(eop_24.text)
+    print(eop_24.text)
 
 # eop_int = EOP_format(description_fname = 'description_int.csv',
 #                  description_cnt = "2023a_int_standalone.cnt" ,
@@ -392,4 +429,3 @@ print(eop_24.text)
 # desc = Block('session','HEADER','description.csv',control_file="2023a_int_standalone.cnt")
 # header =Block('','header2.csv',header=True)
 # data_block = DataBlock('session','test_eob.eob')
-
@@ -1,8 +1,9 @@
 import os
 import logging
-import math
 from pathlib import Path
 
+import numpy as np
+
 from utils import app
 from utils.files import remove
 from aps import solve
@@ -14,6 +15,47 @@ from aps.eob import eob_to_eops
 logger = logging.getLogger('aps')
 
 
+# Table of site positions read once and kept in numpy array. Reloaded when file is modified.
+class SiteTable:
+
+    def __init__(self, path):
+        self.path, self.modified = path, 0
+        self.index, self.positions = {}, np.empty((0, 2))
+
+    # Read file and replace table only when everything has been read
+    def load(self):
+        names, positions = [], []
+        with open(self.path) as sit:
+            for line in sit:
+                if not line.startswith('$'):
+                    names.append(line[:12].strip())
+                    positions.append([float(x) for x in line[12:].split()[:2]])
+        self.index = {name: row for row, name in enumerate(names)}
+        self.positions = np.array(positions, dtype=float).reshape(-1, 2)
+
+    # Load table if not loaded or file modified since last load
+    def check(self):
+        if (modified := os.stat(self.path).st_mtime) != self.modified:
+            self.load()
+            self.modified = modified
+        return self
+
+    # Compute length of baselines given as list of station name pairs
+    def lengths(self, pairs):
+        rows = np.array([[self.index[sta_1], self.index[sta_2]] for sta_1, sta_2 in pairs], dtype=int).reshape(-1, 2)
+        return np.linalg.norm(self.positions[rows[:, 0]] - self.positions[rows[:, 1]], axis=1)
+
+
+SiteTables = {}
+
+
+# Get table for this site file. Same table is used by all EOPM instances.
+def get_site_table(path):
+    if path not in SiteTables:
+        SiteTables[path] = SiteTable(path)
+    return SiteTables[path].check()
+
+
 class EOPM(EOP):
     # Initialize class with path
     def __init__(self, opa_config, initials, run_simul=False):
@@ -24,9 +66,7 @@ class EOPM(EOP):
 
         options = app.Applications.APS.get('EOPM', dict(sites='/sgpvlbi/apriori/models/2023a_mod.sit',
                                                         min_dist=5000000))
-        with open(options['sites']) as sit:
-            self.sites = {line[:12].strip(): [(lambda x: float(x))(x) for x in line[12:].split()[:2]] for line in
-                          sit.readlines() if not line.startswith('$')}
+        self.sites = get_site_table(options['sites'])
         self.min_dist = options['min_dist']
 
     # Get baseline and station lists
@@ -38,25 +78,29 @@ class EOPM(EOP):
             self.add_error(f'Error reading {spl.name}')
             return [], []
         min_nbr_used_obs = int(self.get_opa_code('NUM_USED_MIN'))
-        baselines, stations = [], []
+        known = set(self.station_names)
+        used, stations = {}, set()
         for run in spool.runs:
             if run.DB_NAME != session.db_name:
                 self.add_error(f'Invalid DB_NAME {run.DB_NAME} in spool file {spl.name}')
                 return [], []
             for name, stats in run.stats['baselines'].items():
-                names = list(map(str.strip, name.split('|')))
-                for sta_name in names:
-                    if sta_name not in self.station_names:
-                        self.add_error(f'No station code {sta_name} was found in the ns table.'
-                                       f' Unknown station or bug?')
-                        return False
-                    stations.append(sta_name)
-                if stats['used'] >= min_nbr_used_obs and \
-                        math.dist(self.sites[names[0]], self.sites[names[1]]) > self.min_dist:
-                    baselines.append(name)
-
-        # Remove duplicates
-        return sorted(list(dict.fromkeys(baselines))), sorted(list(dict.fromkeys(stations)))
+                names = tuple(map(str.strip, name.split('|')))
+                if unknown := [sta_name for sta_name in names if sta_name not in known]:
+                    self.add_error(f'No station code {unknown[0]} was found in the ns table.'
+                                   f' Unknown station or bug?')
+                    return [], []
+                stations.update(names)
+                if stats['used'] >= min_nbr_used_obs:
+                    used[name] = names
+        # Compute length of all baselines in one operation
+        if missing := [sta for names in used.values() for sta in names if sta not in self.sites.index]:
+            self.add_error(f'No position for station {missing[0]} in {self.sites.path}')
+            return [], []
+        lengths = self.sites.lengths(list(used.values()))
+        baselines = [name for name, length in zip(used.keys(), lengths) if length > self.min_dist]
+
+        return sorted(baselines), sorted(stations)
 
     # Run SimpleSimul to get realistic UT1-TAI rms values
     def simulated_rms(self, vgosdb, spool):
@@ -93,18 +137,17 @@ class EOPM(EOP):
         if not self.make_control_file(template, cnt, words, header=True):
             self.add_error(f'could not make control file for eob record')
             return False, None
-        # Call solve script
-        solve.check_lock(self.initials)
-        ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
-        solve.remove_lock(self.initials)
-        if not ans or not solve.check_status(self.initials):
-            path = self.save_bad_solution('solve_', ans)
-            self.add_error(f'Error running solve! Check control file {cnt} or output {path}')
-            return False, None
-        # Read spool file
-        if not (spool := read_spool(initials=self.initials, db_name=vgosdb.name)):
-            self.add_error(f'Error reading spool file SPLF{self.initials}')
-            return False, None
+        # Call solve script and read spool file while initials are locked
+        with solve.SolveLock(self.initials):
+            ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
+            if not ans or not solve.check_status(self.initials):
+                path = self.save_bad_solution('solve_', ans)
+                self.add_error(f'Error running solve! Check control file {cnt} or output {path}')
+                return False, None
+            # Read spool file
+            if not (spool := read_spool(initials=self.initials, db_name=vgosdb.name)):
+                self.add_error(f'Error reading spool file SPLF{self.initials}')
+                return False, None
 
         # Replace RMS for UT1 values if vgos session:
         if self.run_simul and not self.simulated_rms(vgosdb, spool):
@@ -136,10 +179,7 @@ class EOPM(EOP):
 
         # Update eob
         eob = self.get_opa_path('EOPT_FILE')
-        prefix, suffix = os.path.splitext(os.path.basename(eob))
-        tpath = self.get_tmp_file(prefix+'_', suffix)
-        self.update_eop_file(tpath, eob, records)
-        if not self.update_global_file(tpath, eob):
+        if not self.insert_sessions(eob, [records]):
             return False
 
         # Update eopm file
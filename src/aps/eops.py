@@ -32,28 +32,25 @@ class EOPS(EOP):
             if not self.make_control_file(template, cnt, words, header=True):
                 return False  # Failed building control file
 
-            # Call solve script
-            solve.check_lock(self.initials)
-            ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
-            solve.remove_lock(self.initials)
-            if not ans or not solve.check_status(self.initials):
-                path = self.save_bad_solution('solve_',
-                                              ans if ans else f'solve {self.initials} {cnt} returned empty answer')
-                self.add_error(f'Error running solve! Check control file {cnt} or output {path}')
-                return False
+            # Call solve script and read spool file while initials are locked
+            with solve.SolveLock(self.initials):
+                ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
+                if not ans or not solve.check_status(self.initials):
+                    path = self.save_bad_solution('solve_',
+                                                  ans if ans else f'solve {self.initials} {cnt} returned empty answer')
+                    self.add_error(f'Error running solve! Check control file {cnt} or output {path}')
+                    return False
 
-            # Read spool file
-            if not (spool := read_spool(initials=self.initials, db_name=vgosdb.name)):
-                self.add_error(f'Error reading spool file SPLF{self.initials}')
-                return False
+                # Read spool file
+                if not (spool := read_spool(initials=self.initials, db_name=vgosdb.name)):
+                    self.add_error(f'Error reading spool file SPLF{self.initials}')
+                    return False
             # Update EOPB_XY_FILE and EOPB_FILE
             for index, (bcode, wantXY) in enumerate([('EOPB_XY_FILE', True), ('EOPB_FILE', False)]):
                 if eopb := self.get_opa_path(bcode):
                     try:
                         records = [run.make_eob_record(self.name2code, arc_line, wantXY) for run in spool.runs]
-                        tmp_eopb = self.get_tmp_file(prefix=bcode.replace('FILE', '').lower())
-                        self.update_eop_file(tmp_eopb, eopb, records)
-                        self.update_global_file(tmp_eopb, eopb)
+                        self.insert_sessions(eopb, [records])
 
                         scode = bcode.replace('EOPB', 'EOPS')
                         tmp_eops = self.get_tmp_file(prefix=scode.replace('FILE', '').lower())
@@ -3,6 +3,7 @@ import re
 from datetime import datetime
 
 from aps.process import APSprocess
+from aps.global_file import GlobalLock, ArcIndex
 
 
 # Class use to update GLO_ARC_FILE
@@ -47,6 +48,17 @@ class GAL(APSprocess):
         #  tmpfile
         prefix, suffix = os.path.splitext(os.path.basename(gpath))
         tpath = self.get_tmp_file(prefix+'_', suffix)
+        # Lock global file so that concurrent updates are not lost
+        with GlobalLock(gpath):
+            index = ArcIndex(gpath, self.get_key)
+            if index.is_sorted:
+                index.splice(tpath, db_key, f'{new_arc_line}\n')
+            else:  # Cannot use binary search. Read file line by line.
+                self.rewrite_arc_file(tpath, gpath, db_key, new_arc_line)
+            return self.update_global_file(tpath, gpath)
+
+    # Insert new arc line by reading all lines of arc file
+    def rewrite_arc_file(self, tpath, gpath, db_key, new_arc_line):
         with open(tpath, 'w') as tmp, open(gpath, errors='ignore') as glo:
             # Read lines and decode key for each valid line
             for line in glo:
@@ -61,4 +73,3 @@ class GAL(APSprocess):
             # Write at end of file
             if db_key:
                 print(new_arc_line, file=tmp)
-        return self.update_global_file(tpath, gpath)
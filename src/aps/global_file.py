@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+
+CHUNK = 1048576  # Size of blocks copied between global files
+
+
+# Compute digest using beginning and end of file
+def file_digest(path, size):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        md5.update(f.read(4096))
+        f.seek(max(0, size - 4096))
+        md5.update(f.read())
+    return md5.hexdigest()
+
+
+# Exclusive lock on global file. Lock is on separate file since global file is replaced when updated.
+class GlobalLock:
+
+    def __init__(self, path, timeout=300):
+        self.path, self.timeout, self.file = f'{path}.lock', timeout, None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def acquire(self):
+        self.file = open(self.path, 'a')
+        t_end = time.time() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.time() > t_end:
+                    self.file.close()
+                    raise TimeoutError(f'{self.path} locked for more than {self.timeout} seconds')
+                time.sleep(0.5)
+
+    def release(self):
+        if self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+# Index of sorted groups of records in global file. Saved in sidecar file and validated using size and digest.
+# Each group has a key and covers bytes [start, end) of the file.
+class GlobalIndex(ABC):
+
+    def __init__(self, path, get_key):
+        self.path, self.idx_path, self.get_key = path, f'{path}.idx', get_key
+        self.keys, self.starts, self.ends = [], [], []
+        self.size, self.is_sorted = 0, True
+
+        if not self.load():
+            self.build()
+            self.save()
+
+    # Load index from sidecar file. Return False if it does not exist or not valid for current file
+    def load(self):
+        try:
+            with open(self.idx_path) as f:
+                info = json.load(f)
+            if info['size'] != (size := os.path.getsize(self.path)) or info['digest'] != file_digest(self.path, size):
+                return False
+            self.keys, self.starts, self.ends, self.size = info['keys'], info['starts'], info['ends'], info['size']
+            return True
+        except (IOError, ValueError, KeyError):
+            return False
+
+    # Save index for path (current global file or new temporary file)
+    def save(self, path=None):
+        if not self.is_sorted:
+            return
+        try:
+            with open(self.idx_path, 'w') as f:
+                json.dump(dict(size=self.size, digest=file_digest(path if path else self.path, self.size),
+                               keys=self.keys, starts=self.starts, ends=self.ends), f)
+        except IOError:
+            pass  # Index will be rebuilt next time
+
+    # Read file and return list of (key, start, end). Return None if file could not be indexed.
+    @abstractmethod
+    def read_groups(self, file):
+        pass
+
+    # Read global file and build index
+    def build(self):
+        with open(self.path, 'rb') as f:
+            groups = self.read_groups(f)
+            self.size = f.seek(0, os.SEEK_END)
+        if groups is None:
+            self.is_sorted = False
+            return
+        self.keys, self.starts, self.ends = [list(column) for column in zip(*groups)] if groups else ([], [], [])
+        self.is_sorted = all(a <= b for a, b in zip(self.keys, self.keys[1:]))
+
+    # Write new file with groups having this key replaced by text. Unchanged parts of the file are copied by blocks.
+    def splice(self, tpath, key, text):
+        lo, hi, nbr = bisect_left(self.keys, key), bisect_right(self.keys, key), len(self.keys)
+        insert_at = self.starts[hi] if hi < nbr else self.size
+        data = text.encode('utf-8')
+
+        with open(self.path, 'rb') as src, open(tpath, 'wb') as out:
+            def copy(start, end):
+                src.seek(start)
+                while (remaining := end - src.tell()) > 0 and (chunk := src.read(min(remaining, CHUNK))):
+                    out.write(chunk)
+
+            position = 0
+            for index in range(lo, hi):  # Skip old groups with same key
+                copy(position, self.starts[index])
+                position = self.ends[index]
+            copy(position, insert_at)
+            if insert_at == self.size and self.size:  # Make sure last line of file has end of line
+                src.seek(self.size - 1)
+                if src.read(1) != b'\n':
+                    out.write(b'\n')
+            start = out.tell()
+            out.write(data)
+            copy(insert_at, self.size)
+            size = out.tell()
+
+        # Update index. All groups after insert point are shifted
+        shift = size - self.size
+        self.keys[lo:] = [key] + self.keys[hi:]
+        self.starts[lo:] = [start] + [offset + shift for offset in self.starts[hi:]]
+        self.ends[lo:] = [start + len(data)] + [offset + shift for offset in self.ends[hi:]]
+        self.size = size
+        self.save(tpath)
+
+
+# Index of GLO_ARC_FILE. Each line with a valid key is a group. Comments stay in place.
+class ArcIndex(GlobalIndex):
+
+    def read_groups(self, file):
+        groups, offset = [], 0
+        for raw in file:
+            if key := self.get_key(raw.decode('utf-8', errors='ignore')):
+                groups.append((key, offset, offset + len(raw)))
+            offset += len(raw)
+        return groups
+
+
+# Index of weight files. Groups are comments, records and '*' line, as written by Weight.insert_records.
+class WeightIndex(GlobalIndex):
+
+    def __init__(self, path, get_key, format_record):
+        self.format_record = format_record
+        super().__init__(path, get_key)
+
+    def read_groups(self, file):
+        groups, offset, start, key, records = [], 0, 0, None, 0
+        for raw in file:
+            line = raw.decode('utf-8', errors='ignore')
+            if line.strip() == '*':
+                if not records:
+                    return None
+                groups.append((key, start, offset + len(raw)))
+                start, key, records = offset + len(raw), None, 0
+            elif not line.strip() or (line.startswith('*') and records):
+                return None  # Not the layout written by Weight
+            elif not line.startswith('*'):
+                if not (new_key := self.get_key(line)) or (key and new_key != key) \
+                        or self.format_record(line) != line:
+                    return None
+                key, records = new_key, records + 1
+            offset += len(raw)
+        # Last group must be closed and keys unique
+        if start != offset or any(a[0] >= b[0] for a, b in zip(groups, groups[1:])):
+            return None
+        return groups
@@ -0,0 +1,93 @@
+import os
+import json
+import atexit
+import sqlite3
+from datetime import datetime
+from collections import defaultdict
+
+from utils import app
+
+
+# Path of history database shared by all analysts of this analysis center. Could be set in APS section of config file
+def history_path(ac_code):
+    path = app.Applications.APS.get('History', os.path.join(app.VLBIfolders.session,
+                                                            f'.aps-history-{ac_code.lower()}.sqlite3'))
+    return os.path.expanduser(path)
+
+
+# Store of APS processing history for all sessions of an analysis center (sqlite database).
+# Actions are appended when done or cleared (empty done). Full history of session is saved at same time as .aps file
+# and older action records of the session are then removed.
+class HistoryStore:
+
+    Tables = ["CREATE TABLE IF NOT EXISTS sessions (ses_id TEXT PRIMARY KEY, db_name TEXT, wrapper TEXT, "
+              "history TEXT, updated TEXT)",
+              "CREATE TABLE IF NOT EXISTS actions (ses_id TEXT, name TEXT, done TEXT, user TEXT)",
+              "CREATE INDEX IF NOT EXISTS actions_session ON actions (ses_id)"]
+
+    def __init__(self, path):
+        self.path = path
+        self.con = sqlite3.connect(path, timeout=60)
+        for sql in self.Tables:
+            self.con.execute(sql)
+        self.con.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    # Append action or submission done for session. Empty done clears the action.
+    def add_action(self, ses_id, name, done, user=''):
+        self.con.execute("INSERT INTO actions VALUES (?, ?, ?, ?)", (ses_id.lower(), name, done, user))
+        self.con.commit()
+
+    # Save full history of session and keep only last record of each action
+    def save(self, ses_id, history):
+        definition, ses_id = history.get('Definition', {}), ses_id.lower()
+        with self.con:
+            self.con.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                             (ses_id, definition.get('DB_name', ''), definition.get('Wrapper', ''),
+                              json.dumps(history), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            self.con.execute("DELETE FROM actions WHERE ses_id = ? AND rowid NOT IN "
+                             "(SELECT MAX(rowid) FROM actions WHERE ses_id = ? GROUP BY name)", (ses_id, ses_id))
+
+    # Load full history of session
+    def load(self, ses_id):
+        row = self.con.execute("SELECT history FROM sessions WHERE ses_id = ?", (ses_id.lower(),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Get last record of each action for all sessions (or list of sessions). Empty done means action was cleared.
+    def status(self, ses_ids=None):
+        sql, values = "SELECT MAX(rowid) FROM actions", []
+        if ses_ids:
+            sql += f" WHERE ses_id IN ({','.join('?' * len(ses_ids))})"
+            values = [ses_id.lower() for ses_id in ses_ids]
+        status = defaultdict(dict)
+        for ses_id, name, done in self.con.execute("SELECT ses_id, name, done FROM actions WHERE rowid IN "
+                                                   f"({sql} GROUP BY ses_id, name)", values):
+            status[ses_id][name] = done
+        return status
+
+
+Stores = {}
+
+
+# Get store for this path. Connection is shared by all sessions processed by this process.
+def get_history_store(path):
+    if (key := (path, os.getpid())) not in Stores:
+        Stores[key] = HistoryStore(path)
+    return Stores[key]
+
+
+# Close connections opened by this process
+@atexit.register
+def close_stores():
+    for (path, pid), store in list(Stores.items()):
+        if pid == os.getpid():
+            store.close()
+            Stores.pop((path, pid))
@@ -1,41 +1,84 @@
+import time
+from bisect import bisect_right
 from pathlib import Path
 
+import numpy as np
+
 from utils import app, to_float
 
-UT1LS = None
 
+# Table of leap seconds loaded once in sorted arrays. Reloaded when file is modified.
+class LeapSeconds:
+    CheckInterval = 60  # Minimum number of seconds between checks of file modified time
+
+    def __init__(self, path=None):
+        self.path = path
+        self.jds, self.values, self.modified, self.checked = [], [], 0, 0
+        self.np_jds = self.np_values = None
 
-# Setup so it read only once
-def read_ut1ls():
-    global UT1LS
+    # Path of leap seconds file in APS configuration
+    def get_path(self):
+        return Path(self.path if self.path else app.Applications.APS['Files']['LeapSeconds'])
 
-    if not UT1LS:
-        UT1LS = {'first': None, 'last': None, 'data': [], 'modified': 0}
-    if not (path := Path(app.Applications.APS['Files']['LeapSeconds'])).exists():
-        raise Exception(f'{str(path)} does not exist!')
-    if (modified := path.stat().st_mtime) != UT1LS['modified']:
-        UT1LS['modified'] = modified
+    # Read file and replace tables only when everything has been read
+    def load(self, path):
+        jds, values = [], []
         try:
             with open(path) as ls:
                 for line in ls:
-                    JD, TAImUTC = to_float(line[17:26]), to_float(line[36:48])
-                    if not UT1LS['first']:
-                        UT1LS['first'] = JD
-                    UT1LS['last'] = JD
-                    UT1LS['data'].append((JD, TAImUTC))
+                    jds.append(to_float(line[17:26]))
+                    values.append(-to_float(line[36:48]))  # UTC - TAI
         except Exception as err:
             raise Exception(f'Problem reading leap seconds file [{str(err)}]')
+        if not jds:
+            raise Exception(f'{str(path)} is empty!')
+        self.jds, self.values = jds, values
+        self.np_jds, self.np_values = np.array(jds), np.array(values)
+
+    # Load table if not loaded or file modified since last load
+    def check(self):
+        if self.jds and time.time() - self.checked < self.CheckInterval:
+            return
+        if not (path := self.get_path()).exists():
+            raise Exception(f'{str(path)} does not exist!')
+        if (modified := path.stat().st_mtime) != self.modified:
+            self.load(path)
+            self.modified = modified
+        self.checked = time.time()
+
+    @property
+    def first(self):
+        return self.jds[0]
+
+    @property
+    def last(self):
+        return self.jds[-1]
+
+    # Get UTC - TAI for specific julian date
+    def get(self, julian_date):
+        self.check()
+        # Test out of limit
+        if julian_date < self.first or julian_date > self.last:
+            raise Exception(f'{julian_date} not between {self.first} and {self.last}')
+        return self.values[bisect_right(self.jds, julian_date) - 1]
 
+    # Get UTC - TAI for array of julian dates
+    def get_array(self, julian_dates):
+        self.check()
+        julian_dates = np.asarray(julian_dates, dtype=float)
+        if julian_dates.size and (julian_dates.min() < self.first or julian_dates.max() > self.last):
+            raise Exception(f'{julian_dates.min()} - {julian_dates.max()} not between {self.first} and {self.last}')
+        return self.np_values[np.searchsorted(self.np_jds, julian_dates, side='right') - 1]
 
-# Get UT1 - TAI for specific julian date
+
+UT1LS = LeapSeconds()
+
+
+# Get UTC - TAI for specific julian date
 def get_UTC_minus_TAI(julian_date):
-    read_ut1ls()
-    # Test out of limit
-    if julian_date < UT1LS['first'] or julian_date > UT1LS['last']:
-        raise Exception(f'{julian_date} not between {UT1LS["first"]} and {UT1LS["last"]}')
-
-    for JD, TAImUTC in UT1LS['data']:
-        if JD > julian_date:
-            break
-        UTCmTAI = -TAImUTC
-    return UTCmTAI
+    return UT1LS.get(julian_date)
+
+
+# Get UTC - TAI for numpy array of julian dates
+def get_UTC_minus_TAI_array(julian_dates):
+    return UT1LS.get_array(julian_dates)
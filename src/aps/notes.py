@@ -2,17 +2,15 @@ from datetime import datetime
 import re
 
 from utils import app
-
+from vgosdb.correlator import NotesFilter, get_notes_filter, clean_old_names
 
 
 class CorrNotes:
-    REJWords, REJExact, Names = [], [], []
+    Filter, Names = NotesFilter([], []), []
 
     clean = re.compile(r'[()/-]').sub
     get_missed = re.compile(r'(\d{3}\-\d{4}[ a-zA-Z])(\-\-|through|and) (\d{3}\-\d{4}[ a-zA-Z]*)').findall
 
-    OLDnames = {'NY ALESUND': 'NYALESUND', 'FORTALEZA': 'FORTLEZA', 'ALGONQUIN': 'ALGOPARK'}
-
     def __init__(self, session, keep_ok = False):
 
         self.comments, self.session, self.keep_ok = {}, session, keep_ok
@@ -20,25 +18,11 @@ class CorrNotes:
 
         self.read_notes()
 
-    # Check if sentence must be rejected
-    def is_rejected(self, not_interesting_words, sentence):
-        for word in not_interesting_words.split():
-            if word not in sentence:
-                return False
-        return True
-
-    # Make sure the old names are not used
-    def clean_old_names(self, line):
-        for old_name, new_name in self.OLDnames.items():
-            pattern = re.compile(old_name, re.IGNORECASE)
-            line = pattern.sub(new_name, line)
-        return line
-
     # Get the station name in the line
     def get_station_name(self, line):
         if line.find(':') > -1:
             try:
-                line = self.clean_old_names(line.strip())
+                line = clean_old_names(line.strip())
                 index = line.find(':')
                 info = CorrNotes.clean(' ', line[:index]).split()
                 if len(info) > 1:
@@ -98,19 +82,12 @@ class CorrNotes:
             sentence = phrase.lower()
             if sentence.startswith('ok') and not self.keep_ok:
                 continue
-            for word in CorrNotes.REJexact:
-                if word in sentence:
-                    phrase = ''
-                    break
-
-            if phrase:
-                for words in CorrNotes.REJwords:
-                    if self.is_rejected(words, sentence):
-                        phrase = self.decode_data_minus(sentence) if words == 'data minus' else ''
-                        break
-                else:
-                    if ('scan' in sentence and 'missed' in sentence) or 'no data' in sentence:
-                        phrase = self.decode_data_minus(sentence)
+            if (rule := CorrNotes.Filter.rejected_by(sentence)) == 'data minus':
+                phrase = self.decode_data_minus(sentence)
+            elif rule:
+                phrase = ''
+            elif ('scan' in sentence and 'missed' in sentence) or 'no data' in sentence:
+                phrase = self.decode_data_minus(sentence)
 
             if phrase := phrase.strip():
                 phrases.append(phrase[0].upper() + phrase[1:])
@@ -165,7 +142,6 @@ class CorrNotes:
     @staticmethod
     def load_static_data(names):
         rejected = app.Applications.APS['CorrNotes']
-        CorrNotes.REJWords = rejected['words']
-        CorrNotes.REJExact = rejected['exact']
+        CorrNotes.Filter = get_notes_filter(tuple(rejected['words']), tuple(rejected['exact']))
         CorrNotes.Names = names
 
@@ -3,6 +3,17 @@ from copy import deepcopy
 from datetime import datetime
 
 from utils import readDICT, saveDICT, app
+from aps.history import get_history_store, history_path
+
+APScontrol = {'lastmod': None, 'info': None}
+
+
+# Get APS control file. File is read again only if modified.
+def get_aps_control():
+    lastmod, info = app.load_control_file(name=app.ControlFiles.APS, lastmod=APScontrol['lastmod'])
+    if info:
+        APScontrol.update(lastmod=lastmod, info=info)
+    return APScontrol['info']
 
 
 class Processing:
@@ -23,11 +34,12 @@ class Processing:
         self.Reports, self.SpoolFiles, self.TempReport = [], [], ''
 
         self.path = os.path.join(self.session.folder, f'{self.session.code}.aps')
+        self.store = get_history_store(history_path(self.ac_codes[0]))
         self.read()
 
-    # Read history file from session folder
+    # Read history file from session folder (or history store if file not available)
     def read(self):
-        if history := readDICT(self.path):
+        if history := readDICT(self.path) or self.store.load(self.session.code):
             _actions = deepcopy(self.Actions)
             for name in self.groups:
                 setattr(self, name, history.get(name, None))
@@ -37,21 +49,36 @@ class Processing:
                                 for name in self.Ordering['Submissions']}
         else:
             self.save()
+        # Apply actions done or cleared since history file was saved
+        for action, done in self.store.status([self.session.code]).get(self.session.code.lower(), {}).items():
+            self.set_done(action, done)
 
-    # Save history of actions in session file
+    # Save history of actions in session file and in history store
     def save(self):
-        saveDICT(self.path, {name: getattr(self, name) for name in self.groups})
+        history = {name: getattr(self, name) for name in self.groups}
+        saveDICT(self.path, history)
+        self.store.save(self.session.code, history)
 
-    # Set action or submission as done
+    # Set time action or submission has been done (empty if cleared)
+    def set_done(self, action, done):
+        for group in (self.Actions, self.Submissions):
+            if action in group:
+                group[action]['done'] = done
+
+    # Set action or submission as done. Only action is appended to history store, history file is saved by caller.
     def done(self, action):
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        if action in self.Actions:
-            self.Actions[action]['done'] = now
-        elif action in self.Submissions:
-            self.Submissions[action]['done'] = now
-        self.save()  # Save after each action
+        self.set_done(action, now)
+        self.store.add_action(self.session.code, action, now, os.environ.get('USER', ''))
         return now
 
+    # Clear action or submission (all of them if action is None) so that it has to be done again
+    def reset(self, action=None):
+        for name in [action] if action else list(self.Actions) + list(self.Submissions):
+            self.set_done(name, '')
+            self.store.add_action(self.session.code, name, '', os.environ.get('USER', ''))
+        self.save()
+
     # Check if AC should be doing IVS solution
     def check_agency(self):
         return self.session.analysis_center.upper() in self.ac_codes
@@ -68,7 +95,7 @@ class Processing:
 
     # Initialize actions so they are in the right order
     def init_required(self):
-        info = app.load_control_file(name=app.ControlFiles.APS)[-1]
+        info = get_aps_control()
         label = info['Title']
         ses_type = 'Intensive' if self.session.type == 'intensive' else 'Standard'
         ordering = {'Actions': [name for action in info[ses_type]['Action'] for name in action.keys()],
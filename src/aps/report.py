@@ -1,6 +1,5 @@
 import os
 
-from datetime import timedelta
 from io import StringIO
 from collections import defaultdict
 
@@ -272,47 +271,18 @@ class INTreport(STDreport):
         super().__init__(session, vgosdb, spool)
         self.correlated_sources = defaultdict(lambda: 0)
 
-    def is_corr(self, start, stop, time_list):
-        for t in time_list:
-            if start <= t <= stop:
-                return True
-        return False
-
     def get_correlated_data(self):
         if not self.schedule:
             return []
 
-        # Make a dictionary of scans using baseline-source as Key
-        corr = defaultdict(list)
-        for index, bl, src, utc, qc_x, qc_s, fc_x, fc_s, flg in self.vgosdb.get_all_obs():
-            # Store time of each scan
-            key = f'{bl[0]}:{bl[1]}:{src}'
-            corr[key].append(utc)
-            # Store number of correlated scans for each source
-            self.correlated_sources[src] += 1
-
-        removed = set(self.schedule.missed) | set(self.vgosdb.deselected_st)
-        not_corr = []
+        # Sorted times of scans using baseline-source as Key
+        corr = self.vgosdb.get_correlated_times()
+        # Store number of correlated scans for each source
+        for key, times in corr.items():
+            self.correlated_sources[key.split(':')[-1]] += len(times)
         # Extract list of uncorrelated scans.
-        for index, obs in enumerate(self.schedule.obs_list):
-            fr = obs['fr']
-            fr_name = self.schedule.stations['codes'][fr]['name']
-            if fr_name not in self.vgosdb.station_list or fr_name in removed:
-                continue
-            to = obs['to']
-            to_name = self.schedule.stations['codes'][to]['name']
-            if to_name not in self.vgosdb.station_list or to_name in removed:
-                continue
-
-            scan = obs['scan']
-            duration = min(scan['station_codes'][fr]['duration'], scan['station_codes'][to]['duration'])
-            start = scan['start']
-            stop = start + timedelta(seconds=duration)
-            if (key := f'{fr_name}:{to_name}:{obs["scan"]["source"]}') not in corr:
-                key = f'{to_name}:{fr_name}:{obs["scan"]["source"]}'
-            if key not in corr or not self.is_corr(start, stop, corr[key]):
-                not_corr.append(f'{obs["scan"]["source"]:8s} at {start.strftime("%H:%M:%S")}')
-        return not_corr
+        return [f'{source:8s} at {start.strftime("%H:%M:%S")}'
+                for source, start in self.vgosdb.get_uncorrelated_scans(self.schedule, corr)]
 
     def write_comments(self, key, comments, in_line=None):
         # Write analysts comments
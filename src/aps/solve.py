@@ -2,7 +2,8 @@ import os
 import pwd
 import sys
 import stat
-import signal
+import time
+import fcntl
 
 from datetime import datetime
 from subprocess import Popen, PIPE
@@ -42,21 +43,116 @@ def remove_lock(initials):
         os.remove(lock_path)
 
 
-# Python version of check_solve_lock.f
-def check_lock(initials):
+# Check if process is still running
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Running under another user
+        pass
+    return True
+
+
+# Read process id in lock file. Return None if no lock file or invalid.
+def get_lock_pid(initials):
     lock_path = os.path.join(os.environ['WORK_DIR'], 'LOCK' + initials)
-    # Check if lock exists
-    if not os.path.exists(lock_path):
-        return
     try:
-        # Kill process using information in lock_file
         with open(lock_path, 'r') as lck:
-            pid = int(lck.readline().split('proc ID')[1].split()[0])
-            os.kill(pid, signal.SIGKILL)
-    except:  # Nothing we can do
-        pass
-    # Remove lock
+            return int(lck.readline().split('proc ID')[1].split()[0])
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+# Python version of check_solve_lock.f. Lock is removed only if process that created it is not running.
+# Return True if initials are not locked.
+def check_lock(initials):
+    if (pid := get_lock_pid(initials)) and pid != os.getpid() and is_alive(pid):
+        return False
+    # Remove stale lock
     remove_lock(initials)
+    return True
+
+
+# Lock on solve initials shared by all processes using flock. Processes waiting for same initials are served
+# in order of arrival. Stale LOCK files from processes that are not running anymore are removed.
+class SolveLock:
+    Timeout, Interval = 3600, 1
+
+    def __init__(self, initials, timeout=None):
+        work_dir = os.environ['WORK_DIR']
+        self.initials, self.timeout = initials, timeout if timeout else self.Timeout
+        self.path = os.path.join(work_dir, f'.LOCK{initials}')
+        self.queue = f'{self.path}.queue'
+        self.file, self.ticket = None, None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    # Add ticket in queue. Name of ticket is arrival time and pid.
+    def add_ticket(self):
+        os.makedirs(self.queue, exist_ok=True)
+        self.ticket = os.path.join(self.queue, f'{time.time_ns():020d}-{os.getpid():010d}')
+        open(self.ticket, 'w').close()
+
+    # Remove ticket from queue
+    def remove_ticket(self):
+        if self.ticket and os.path.exists(self.ticket):
+            os.remove(self.ticket)
+        self.ticket = None
+
+    # Check if ticket is first in queue. Tickets of processes not running anymore are removed.
+    def is_first(self):
+        for name in sorted(os.listdir(self.queue)):
+            path = os.path.join(self.queue, name)
+            if path == self.ticket:
+                return True
+            try:
+                if not is_alive(int(name.split('-')[-1])):
+                    os.remove(path)
+                    continue
+            except (ValueError, FileNotFoundError):
+                continue
+            return False
+        return True
+
+    # Lock file without waiting
+    def try_lock(self):
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    # Wait until first in queue, file is locked and no solve is running using these initials
+    def acquire(self):
+        self.add_ticket()
+        self.file = open(self.path, 'a')
+        t_end = time.time() + self.timeout
+        try:
+            while True:
+                if self.is_first() and self.try_lock():
+                    if check_lock(self.initials):
+                        break
+                    fcntl.flock(self.file, fcntl.LOCK_UN)  # Solve started outside this lock
+                if time.time() > t_end:
+                    self.file.close()
+                    self.file = None
+                    raise TimeoutError(f'solve {self.initials} locked for more than {self.timeout} seconds')
+                time.sleep(self.Interval)
+        finally:
+            self.remove_ticket()
+
+    def release(self):
+        if self.file:
+            remove_lock(self.initials)
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
 
 
 # Python version of check_solve_complete.f
@@ -34,15 +34,14 @@ class STANDALONE(APSprocess):
         if not self.make_control_file(template, cnt, words, header=True):
             return False
 
-        solve.check_lock(self.initials)
-        ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
-        solve.remove_lock(self.initials)
-        if not ans or 'Solve run was not successful' in ans[-1] or not solve.check_status(self.initials):
-            err_file = self.save_bad_solution('solve_', ans)
-            self.add_error(f'Error running solve! Check control file {cnt} or output {err_file}')
-            return False
-        # Extract important part from spool file and make sinex link
-        return self.store_spool_data(session) and self.make_sinex_link(session, ext)
+        with solve.SolveLock(self.initials):
+            ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
+            if not ans or 'Solve run was not successful' in ans[-1] or not solve.check_status(self.initials):
+                err_file = self.save_bad_solution('solve_', ans)
+                self.add_error(f'Error running solve! Check control file {cnt} or output {err_file}')
+                return False
+            # Extract important part from spool file and make sinex link
+            return self.store_spool_data(session) and self.make_sinex_link(session, ext)
 
     def make_sinex_link(self, session, ext):
         # Check if sinex file exist.
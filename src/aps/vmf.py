@@ -1,8 +1,20 @@
 import os
+from subprocess import Popen, PIPE
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from aps.process import APSprocess
 
 
+# Run external command and return output. Executed in thread of batch runner.
+def run_command(cmd):
+    try:
+        st_out, st_err = Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=PIPE).communicate()
+        return st_out.decode('utf-8'), st_err.decode('utf-8')
+    except Exception as err:
+        return '', str(err)
+
+
 # Class use to update GLO_ARC_FILE
 class VMF(APSprocess):
     # Initialize class with path
@@ -24,24 +36,34 @@ class VMF(APSprocess):
         if not self.total_output_dir and not self.dry_output_dir:
             self.add_error('No valid VMF total or dry output directory were specified in the OPA configuration file.')
 
-    # Execute VMF application for apriori type (TOTAL or DRY)
-    def create_vmf_file(self, apriori, out_dir, vgosdb):
+    # Make command for VMF application for apriori type (TOTAL or DRY). Output folder is created if missing.
+    def make_vmf_command(self, apriori, out_dir, vgosdb):
         if not out_dir:  # No directory so no computation
-            return
+            return None, None
 
         # Extract folder name. Create it if missing
         folder = out_dir.split()[0].strip()
         folder = os.path.join(folder, vgosdb.year) if 'YEAR' in out_dir else folder
-        if not os.path.exists(folder):
-            os.mkdir(folder)
+        os.makedirs(folder, exist_ok=True)
 
         # Create command for vmf application
         out_file = os.path.join(folder, vgosdb.name+'.trp')
-        cmd = f'{self.vmf_exec} {vgosdb.wrapper.name} {out_file} {self.vmf_dir} {apriori}'
-        ans = self.execute_command(cmd, vgosdb.name)
+        return f'{self.vmf_exec} {vgosdb.wrapper.name} {out_file} {self.vmf_dir} {apriori}', out_file
+
+    # Check that VMF application has created output file. Return error message.
+    def check_vmf_output(self, out_file, ans):
         if not ans or f'Made {out_file}' not in ans[-1] or not os.path.exists(out_file):
             path = self.save_bad_solution('solve_', ans)
-            self.add_error(f'{out_file} not created! Check output at {path}')
+            return f'{out_file} not created! Check output at {path}'
+        return None
+
+    # Execute VMF application for apriori type (TOTAL or DRY)
+    def create_vmf_file(self, apriori, out_dir, vgosdb):
+        cmd, out_file = self.make_vmf_command(apriori, out_dir, vgosdb)
+        if cmd:
+            ans = self.execute_command(cmd, vgosdb.name)
+            if err := self.check_vmf_output(out_file, ans):
+                self.add_error(err)
 
     def execute(self, session, vgosdb):
         # Create VMF file for TOTAL and DRY
@@ -49,3 +71,27 @@ class VMF(APSprocess):
         self.create_vmf_file('DRY', self.dry_output_dir, vgosdb)
 
         return not self.has_errors
+
+    # Create TOTAL and DRY files for many vgosDB. VMF applications are executed in parallel using
+    # a limited number of workers. Return dictionary of errors for each vgosDB (empty list if ok).
+    def execute_batch(self, vgosdbs, workers=None):
+        errors = defaultdict(list)
+        with ThreadPoolExecutor(max_workers=workers if workers else os.cpu_count()) as pool:
+            jobs = {}
+            for vgosdb in vgosdbs:
+                errors[vgosdb.name] = []
+                for apriori, out_dir in (('TOTAL', self.total_output_dir), ('DRY', self.dry_output_dir)):
+                    try:
+                        if (job := self.make_vmf_command(apriori, out_dir, vgosdb))[0]:
+                            jobs[pool.submit(run_command, job[0])] = (vgosdb.name, apriori, job[1])
+                    except OSError as err:
+                        errors[vgosdb.name].append(f'{apriori} {str(err)}')
+            for future, (db_name, apriori, out_file) in jobs.items():
+                st_out, st_err = future.result()
+                self.save_output(f'{db_name}_{apriori}', st_out, 'txt')
+                self.save_output(f'{db_name}_{apriori}', st_err, 'err')
+                if st_err:
+                    errors[db_name].append(st_err)
+                if err := self.check_vmf_output(out_file, st_out.splitlines() if st_out else f'ERROR: {st_err}'):
+                    errors[db_name].append(err)
+        return errors
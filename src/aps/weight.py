@@ -1,8 +1,10 @@
 import os
+from io import StringIO
 from datetime import datetime
 
 from aps.process import APSprocess
 from aps import solve
+from aps.global_file import GlobalLock, WeightIndex
 
 
 # Base class use to update WEIGHT files
@@ -35,13 +37,17 @@ class Weight(APSprocess):
             records = [line for line in f.readlines() if not line.startswith('*')]
         return self.get_key(records[0]), {'comments': [], 'records': records}
 
+    # Format record as written in weight file
     @staticmethod
-    def insert_records(grp, file):
+    def format_record(record):
+        vgosdb, version, data = record.split(maxsplit=2)
+        return f'{vgosdb:<23s} {version:>3s} {data}'
+
+    def insert_records(self, grp, file):
         for comment in grp['comments']:
             print(comment, end='', file=file)
         for record in grp['records']:
-            vgosdb, version, data = record.split(maxsplit=2)
-            print(f'{vgosdb:<23s} {version:>3s} {data}', end='', file=file)
+            print(self.format_record(record), end='', file=file)
         print('*', file=file)
 
     def update_weight_file(self, template, gpath, session, vgosdb):
@@ -55,11 +61,10 @@ class Weight(APSprocess):
             return False
 
         # Call solve script
-        solve.check_lock(self.initials)
-        ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
-        solve.remove_lock(self.initials)
-        if not ans or 'Solve run was not successful' in ans[-1] or not solve.check_status(self.initials) \
-                or not os.path.exists(weight_file):
+        with solve.SolveLock(self.initials):
+            ans = self.execute_command(f'solve {self.initials} {cnt} silent', vgosdb.name)
+            failed = not ans or 'Solve run was not successful' in ans[-1] or not solve.check_status(self.initials)
+        if failed or not os.path.exists(weight_file):
             path = self.save_bad_solution('solve_', ans)
             self.add_error(f'Error running solve! Check control file {cnt} or output {path}')
             self.add_error(f'Weight file {weight_file}')
@@ -72,6 +77,26 @@ class Weight(APSprocess):
             return None  # Do not remove cnt, weight_file to look at them
 
         # Update a temporary copy of the global file
+        key, grp = self.read_new_records(weight_file)
+        prefix, suffix = os.path.splitext(gpath)
+        tpath = self.get_tmp_file(prefix=prefix + '_', suffix=suffix)
+        # Lock global file so that concurrent updates are not lost
+        with GlobalLock(gpath):
+            index = WeightIndex(gpath, self.get_key, self.format_record)
+            if index.is_sorted:
+                text = StringIO()
+                self.insert_records(grp, text)
+                index.splice(tpath, key, text.getvalue())
+            else:  # Not in sorted layout. Read all records and sort them.
+                self.rewrite_weight_file(tpath, gpath, key, grp)
+
+            # Remove cnt and weight file
+            self.remove_files(cnt, weight_file)
+            # Update the global file
+            return self.update_global_file(tpath, gpath)
+
+    # Read all records of weight file, insert new records and save them sorted in temporary file
+    def rewrite_weight_file(self, tpath, gpath, new_key, new_grp):
         groups = {}
         with open(gpath) as glo:
             found, comments = False, []
@@ -86,16 +111,7 @@ class Weight(APSprocess):
                 else:
                     groups[key]['records'].append(line)
 
-        # Insert new weight records, sort and save in temporary file
-        key, grp = self.read_new_records(weight_file)
-        groups[key] = grp
-        prefix, suffix = os.path.splitext(gpath)
-        tpath = self.get_tmp_file(prefix=prefix + '_', suffix=suffix)
+        groups[new_key] = new_grp
         with open(tpath, 'w') as tmp:
             for key in sorted(list(groups.keys())):
                 self.insert_records(groups[key], tmp)
-
-        # Remove cnt and weight file
-        self.remove_files(cnt, weight_file)
-        # Update the global file
-        return self.update_global_file(tpath, gpath)
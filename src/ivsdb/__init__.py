@@ -4,8 +4,8 @@ import sys
 import re
 from datetime import datetime
 
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy import create_engine, event, exists, and_
+from sqlalchemy.orm import sessionmaker, scoped_session, selectinload
+from sqlalchemy import create_engine, event, exists, and_, func
 from sqlalchemy.engine import Engine
 from sshtunnel import SSHTunnelForwarder
 
@@ -54,6 +54,30 @@ def _set_sqlite_pragma(conn, record):
         cursor.close()
 
 
+# Lightweight session information with list of stations returned by bulk queries
+class SessionRow:
+    def __init__(self, code, name, ses_type, start, duration, operations_center, correlator, analysis_center):
+        self.code, self.name, self.type, self.start, self.duration = code, name, ses_type, start, duration
+        self.operations_center, self.correlator, self.analysis_center = operations_center, correlator, analysis_center
+        self.stations, self.included, self.removed = [], [], []
+
+    def __str__(self):
+        return f'{self.code:8} {self.name:10} {self.start.strftime("%Y-%m-%d %H:%M")} {",".join(self.included)}'
+
+    @property
+    def year(self):
+        return self.start.strftime('%Y')
+
+    @property
+    def is_intensive(self):
+        return self.type == 'intensive'
+
+    # Add station using its status in session
+    def add_station(self, sta_id, status):
+        self.stations.append(sta_id)
+        (self.included if status == 'included' else self.removed).append(sta_id)
+
+
 # Class to handle sqlite database using sqlalchemy
 # scoped_sessions is used for multithreading
 class IVSdata:
@@ -141,9 +165,11 @@ class IVSdata:
 
     # Get a VLBI session using the session code
     def get_session(self, code, create=False):
-        if create:
-            return self.get_or_create(models.Session, code=code)
-        return self.get(models.Session, code=code)
+        session = self.get_or_create(models.Session, code=code) if create else self.get(models.Session, code=code)
+        # Stations are read now since session is often used after database is closed
+        if session:
+            session.load_stations()
+        return session
 
     # Get session code using the db_name
     def get_db_session_code(self, db_name):
@@ -165,6 +191,41 @@ class IVSdata:
             and_(models.Session.start.between(start, end), models.Session.type.in_(masters))).order_by(
             models.Session.start.asc()).all()]
 
+    # Get sessions for a specific period in one query. Stations are loaded with the sessions.
+    def get_session_list(self, start, end, masters):
+        return self.orm_ses.query(models.Session).options(selectinload(models.Session.participating)).filter(
+            and_(models.Session.start.between(start, end), models.Session.type.in_(masters))).order_by(
+            models.Session.start.asc()).all()
+
+    # Get sessions for a period (or list of codes) with their stations using one joined query.
+    # Return list of SessionRow ordered by start time.
+    def get_session_rows(self, start=None, end=None, masters=None, codes=None):
+        ses, sta = models.Session, models.SessionStation
+        query = self.orm_ses.query(ses.code, ses.name, ses.type, ses.start, ses.duration, ses.operations_center,
+                                   ses.correlator, ses.analysis_center, sta.station, sta.status
+                                   ).outerjoin(sta, sta.session == ses.code)
+        if start and end:
+            query = query.filter(ses.start.between(start, end))
+        if masters:
+            query = query.filter(ses.type.in_(masters))
+        if codes is not None:
+            query = query.filter(ses.code.in_(codes))
+        rows = {}
+        for *info, sta_id, status in query.order_by(ses.start.asc(), ses.code.asc(), sta.station.asc()):
+            if (row := rows.get(info[0])) is None:
+                row = rows[info[0]] = SessionRow(*info)
+            if sta_id:
+                row.add_station(sta_id, status)
+        return list(rows.values())
+
+    # Signature of sessions and session_stations tables. Changes when sessions or stations are added, removed,
+    # or updated (session_stations has no updated column so station status changes are counted)
+    def get_last_session_update(self):
+        ses, sta = models.Session, models.SessionStation
+        sessions = self.orm_ses.query(func.count(ses.code), func.max(ses.updated)).one()
+        stations = self.orm_ses.query(sta.status, func.count(sta.station)).group_by(sta.status).all()
+        return tuple(sessions), tuple(sorted((tuple(row) for row in stations), key=str))
+
     # Request all sessions using a list of names
     def get_sessions_from_names(self, lst):
         return [rec[0] for rec in self.orm_ses.query(models.Session.code).filter(models.Session.name.in_(lst)).all()]
@@ -2,13 +2,29 @@ import re
 import os
 import traceback
 from datetime import datetime, timedelta
+from difflib import SequenceMatcher
 
-from ivsdb.models import OperationsCenter, Correlator, AnalysisCenter, Station, Session, SessionStation
+from ivsdb.models import OperationsCenter, Correlator, AnalysisCenter, Station, SessionStation
 from utils import utctime, app, to_float
 
 
-# def load codes from master-format file
-def load_master_format(dbase, path):
+# Get lines removed and added between old and new version of a file. Return None if no old version.
+def diff_lines(old_path, new_path):
+    if not os.path.exists(old_path):
+        return None
+    with open(old_path, 'r') as old_file, open(new_path, 'r') as new_file:
+        old, new = old_file.read().splitlines(), new_file.read().splitlines()
+    removed, added = [], []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag in ('replace', 'delete'):
+            removed.extend(old[i1:i2])
+        if tag in ('replace', 'insert'):
+            added.extend(new[j1:j2])
+    return removed, added
+
+
+# def load codes from master-format file. File is small and lines depend on section so diff is not used.
+def load_master_format(dbase, path, diff=None):
     classes = {'SKED CODES': OperationsCenter, 'CORR CODES': Correlator, 'SUBM CODES': AnalysisCenter}
 
     category = cls = None
@@ -33,12 +49,13 @@ def load_master_format(dbase, path):
         return False
 
 
-# Load ns-codes.txt file
-def load_ns_codes(dbase, path):
+# Load ns-codes.txt file. Only added or modified lines are loaded when diff is provided.
+def load_ns_codes(dbase, path, diff=None):
     try:
         with open(path, 'r') as file:
-            for line in file.readlines():
-                if line[0] != '*':
+            lines = diff[1] if diff else file.readlines()
+            for line in lines:
+                if line and line[0] != '*':
                     fields = [field.strip('-') for field in line.strip().split()]
                     stn = dbase.get_or_create(Station, code=fields[0].casefold())
                     stn.name, stn.domes, stn.cdp = fields[1:4]
@@ -77,8 +94,9 @@ def decode_start(version, year, record):
 
 
 # Read master file and store session information in database.
-# Some checks are not done because file has already been validated
-def parse_master(dbase, path):
+# Some checks are not done because file has already been validated.
+# When diff is provided, only sessions in removed or added lines are updated.
+def parse_master(dbase, path, diff=None):
     types = app.load_control_file(name=app.ControlFiles.Types)[-1]
     types = {ses_id.upper(): ses_type.upper() for ses_type, sessions in types.items() for ses_id in sessions}
 
@@ -95,9 +113,18 @@ def parse_master(dbase, path):
     # Extract type from path and create old and new name
     ses_type = {'-int': 'intensive', '-vgos': 'vgos'}.get(
         re.match(r'master(\d*)(?P<type>(|-int|-vgos))?\.txt', os.path.basename(path))['type'], 'standard')
-    # Delete all records from old master file
-    for (ses_id, _) in dbase.get_sessions_from_year(year, [ses_type]):
-        dbase.delete(dbase.get_session(ses_id))
+    # Full reload if any header line has changed since old lines may use another format
+    if diff and not any(line.startswith('##') for line in diff[0] + diff[1]):
+        # Delete sessions in removed lines. They are created again if in added lines.
+        index = COLUMNS.get(version).index('code') + 1
+        for code in [line.split('|')[index].strip().lower() for line in diff[0] if line.startswith('|')]:
+            if session := dbase.get_session(code):
+                dbase.delete(session)
+        lines = diff[1]
+    else:
+        # Delete all records from old master file
+        for (ses_id, _) in dbase.get_sessions_from_year(year, [ses_type]):
+            dbase.delete(dbase.get_session(ses_id))
     dbase.flush()
     # Extract session information. Use new master name for database
     for data in [line.strip().split('|')[1:-1] for line in lines if line.startswith('|')]:
@@ -119,7 +146,7 @@ def parse_master(dbase, path):
                 warnings.append(f'{code} added to Network Stations')
         dbase.flush()
         # Add record to database
-        session = dbase.get_or_create(Session, code=record['code'], )
+        session = dbase.get_session(record['code'], create=True)
         session.corr_status = record['status']
         session.start = decode_start(version, year, record)
         session.duration = decode_duration(record['dur'])
@@ -137,14 +164,15 @@ def parse_master(dbase, path):
                     ses_sta = SessionStation(session.code, sta.casefold())
                 ses_sta.status = status
                 session.participating.append(ses_sta)
+        session.load_stations(reload=True)
     return warnings
 
 
-def load_master(dbase, path):
+def load_master(dbase, path, diff=None):
 
     try:
         # Open database
-        warnings = parse_master(dbase, path)
+        warnings = parse_master(dbase, path, diff)
         dbase.commit()
         warnings, nl = ('\n'.join(warnings), '\n') if warnings else ('', '')
         app.notify('DB updated', f'{os.path.basename(path)}{nl}{warnings}')
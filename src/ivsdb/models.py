@@ -148,8 +148,7 @@ class Session(Base):
     def __init__(self, code=None):
         if code:
             self.code, self.correlator, self.operations_center, self.analysis_center = code, 'WASH', 'NASA', 'NASA'
-        self.stations, self.included, self.removed = [], [], []
-        self._has_vlba, self.skd = False, None
+        self._stations, self.skd = None, None
         self._db_name = self._folder = None
 
     def __str__(self):
@@ -165,19 +164,31 @@ class Session(Base):
 
         self.__init__()
         self.make_folder()
-        vlba = app.VLBA.stations
-        for ses_sta in self.participating:
-            self.stations.append(ses_sta.station)
-            if ses_sta.status == 'included':
-                self.included.append(ses_sta.station)
-                if ses_sta.station.capitalize() in vlba:
-                    self._has_vlba = True
-            else:
-                self.removed.append(ses_sta.station)
-
-        self.stations.sort()
-        self.included.sort()
-        self.removed.sort()
+
+    # Lists of stations are made from participating stations when first needed, so that loading sessions
+    # does not load their stations one session at a time. Use reload after participating has been modified.
+    def load_stations(self, reload=False):
+        if self._stations is None or reload:
+            stations, included, removed = [], [], []
+            for ses_sta in self.participating:
+                stations.append(ses_sta.station)
+                (included if ses_sta.status == 'included' else removed).append(ses_sta.station)
+            vlba = app.VLBA.stations
+            has_vlba = any(sta.capitalize() in vlba for sta in included)
+            self._stations = (sorted(stations), sorted(included), sorted(removed), has_vlba)
+        return self._stations
+
+    @property
+    def stations(self):
+        return self.load_stations()[0]
+
+    @property
+    def included(self):
+        return self.load_stations()[1]
+
+    @property
+    def removed(self):
+        return self.load_stations()[2]
 
     @staticmethod
     def build_path(*args, **kwargs):
@@ -189,7 +200,7 @@ class Session(Base):
 
     @property
     def has_vlba(self):
-        return self._has_vlba
+        return self.load_stations()[3]
 
     @property
     def folder(self):
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+pytest.importorskip('pika')
+pytest.importorskip('sqlalchemy')
+
+import VLBIuploader
+from VLBIuploader import UploadState, Uploader, upload_files
+from utils.servers import FTPserver
+
+
+# Upload to local stand-in, crash after upload, then resume recording and removing files
+def test_resume_after_crash(tmp_path, monkeypatch):
+    folder, center, db_path = tmp_path / 'failed_upload', tmp_path / 'center', str(tmp_path / 'state.sqlite3')
+    folder.mkdir()
+    files = {}
+    for name in ('r41050.spl', 'r41050.txt'):
+        (path := folder / name).write_text(name)
+        files[name] = str(path)
+    recorded = []
+    monkeypatch.setattr(VLBIuploader, 'get_server',
+                        lambda category, code: FTPserver({'upload': 'upload_local', 'root': str(center)}))
+    monkeypatch.setattr(VLBIuploader, 'record_submitted_files',
+                        lambda records: recorded.extend(record.name for record in records))
+
+    state = UploadState(db_path)
+    state.sync(files)
+    assert state.get_ready() == sorted(files)
+    for name in upload_files('local', list(files.values())):
+        state.set(name, 'uploaded')
+    state.close()  # Crash before files are recorded
+
+    uploader = Uploader.__new__(Uploader)
+    uploader.state = UploadState(db_path)
+    assert uploader.state.get('uploaded') == sorted(files)
+    uploader.resume(files)
+    assert sorted(recorded) == sorted(files)
+    assert not os.listdir(folder)
+    assert sorted(os.listdir(center)) == sorted(files)
+    assert not uploader.state.get('recorded')
+    uploader.state.close()
+
+
+# File replaced while waiting to be recorded must be uploaded again
+def test_replaced_file_is_pending(tmp_path):
+    (path := tmp_path / 'r41050.spl').write_text('old')
+    state = UploadState(str(tmp_path / 'state.sqlite3'))
+    state.sync({path.name: str(path)})
+    state.set(path.name, 'uploaded')
+    path.write_text('new version')
+    state.sync({path.name: str(path)})
+    assert state.get('pending') == [path.name]
+    state.close()
@@ -15,7 +15,7 @@ from PyQt5.QtGui import QCursor
 
 from utils import app
 from ivsdb import IVSdata, models
-from vgosdb import VGOSdb
+from vgosdb.catalog import VGOScatalog
 from utils.servers import get_server, load_servers, DATACENTER
 from utils import read_app_info, save_app_info, utctime
 
@@ -365,9 +365,11 @@ class ANdash(QMainWindow):
         sessions = {}
         yesterday = (datetime.now() - timedelta(days=1)).date()
         dbase = app.get_dbase()
+        catalog = VGOScatalog()
 
         for rec in dbase.orm_ses.query(models.CorrFile).filter(models.CorrFile.updated > last).all():
             if self.worker.stopped.is_set():
+                catalog.close()
                 return []
             if (ses_id := dbase.get_db_session_code(rec.code)) and (session := dbase.get_session(ses_id)):
                 if self.session_type != 'all' and session.type != self.session_type:
@@ -377,16 +379,18 @@ class ANdash(QMainWindow):
                     continue
                 ses = [(code, False), (session.code, False), (t2s(session.start), False), (t2s(rec.updated), False)]
                 sessions[code] = ses
-                vgosdb = VGOSdb(session.db_folder)
+                if not (vgosdb := catalog.lookup(session.db_folder)):
+                    ses.extend([('Not analyzed', True), ('', True), ('', True)])
+                    continue
 
-                if wrapper := vgosdb.get_first_wrapper('GSFC'):
+                if wrapper := catalog.first_wrapper(vgosdb, 'GSFC'):
                     # Get time of vgosDbCalc (first action after download)
-                    if calc := wrapper.processes.get('vgosDbCalc', None):
+                    if (calc := wrapper['processes'].get('vgosDbCalc', None)) and calc['runtimetag']:
                         downloaded = calc['runtimetag'].astimezone(get_localzone()).replace(tzinfo=None)
                         ses[3] = (t2s(downloaded), False)
-                if wrapper := vgosdb.get_last_wrapper('GSFC'):
-                    if nuSolve := wrapper.processes.get('nuSolve', None):
-                        analyzed = self.get_analyzed_time(vgosdb, nuSolve)
+                if wrapper := catalog.last_wrapper(vgosdb, 'GSFC'):
+                    if nuSolve := wrapper['processes'].get('nuSolve', None):
+                        analyzed = self.get_analyzed_time(vgosdb['folder'], nuSolve)
                         if (datetime.now() - analyzed) > timedelta(days=60):
                             sessions.pop(code)
                         elif analyzed > downloaded:
@@ -405,14 +409,15 @@ class ANdash(QMainWindow):
 
                 ses.extend([('Not analyzed', True), ('', True), ('', True)])
 
+        catalog.close()
         lst = sorted(sessions.values(), key=lambda rec: rec[3][0])
         if self.show_rapid:
                 lst.extend(self.get_observed_rapid(dbase, sessions))
         return lst
 
     # Read analyzed time from history file
-    def get_analyzed_time(self, vgosdb, nuSolve):
-        path = os.path.join(vgosdb.folder, 'History', nuSolve['history'])
+    def get_analyzed_time(self, folder, nuSolve):
+        path = os.path.join(folder, 'History', nuSolve['history'])
         timetags = []
         with open(path) as hist:
             for line in hist:
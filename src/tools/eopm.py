@@ -1,6 +1,7 @@
 from utils import app
 from datetime import datetime
 from aps import APS
+from aps.history import get_history_store, history_path
 import re
 import os
 
@@ -86,12 +87,12 @@ def process_missing_sessions(arguments, processed, master, action, initials):
     dbase = app.get_dbase()
     start, end = datetime(2022, 1, 1), datetime.utcnow()
     index = 1
+    # Status of all sessions is read from history store instead of each .aps file
+    status = get_history_store(history_path(app.Applications.APS['analysis_center'])).status()
     for ses_id in dbase.get_sessions(start, end, [master]):
         if ses_id not in processed:
-            session = dbase.get_session(ses_id)
-            if (aps := session.file_path('aps')).exists():
-                items = readDICT(aps)
-                if done := items['Actions'][action]['done'] and items['Submissions']['SUBMIT-EOPI']['done']:
+            if items := status.get(ses_id.lower()):
+                if done := items.get(action) and items.get('SUBMIT-EOPI'):
                     arguments.param = ses_id
                     # aps = APS(arguments)
                     # aps.run_process('standalone', initials)
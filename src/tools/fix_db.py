@@ -2,9 +2,11 @@ import os
 from pathlib import Path
 import shutil
 import re
+from concurrent.futures import ProcessPoolExecutor
 
-from netCDF4 import Dataset, stringtochar
-import numpy as np
+from netCDF4 import Dataset
+
+from utils import nc
 
 
 # Custom Exception for reporting file and problem
@@ -16,88 +18,110 @@ class Problem(Exception):
         return self.err_msg
 
 
-# Replace code in file since it has same length than old code.
-def replace_session_code(path, code):
-    modified = path.stat().st_mtime
-    with Dataset(path, 'r+', clobber=True) as nc:
-        if 'Session' not in nc.variables:
-            return False
-        try:
-            nc.variables['Session'][:] = stringtochar(np.array([code], 'S'))
-        except ValueError as err:
-            raise Problem(f'Could not update "Session" variable in {str(path)} : {str(err)}')
-    os.utime(path, (modified, modified))
+# Check if Session variable is in netCDF file. Only header is read.
+def has_session(path):
+    try:
+        with Dataset(path) as nc_file:
+            return 'Session' in nc_file.variables
+    except OSError:
+        return False
+
+
+# Replace code in file since it has same length than old code. New file is written to tmp.
+def replace_session_code(path, code, tmp):
+    shutil.copy2(path, tmp)
+    try:
+        nc.patch_dataset(tmp, {'Session': nc.to_chars(code)})
+    except ValueError as err:
+        raise Problem(f'Could not update "Session" variable in {str(path)} : {str(err)}')
     return True
 
 
-# Need to copy all information and change the dimension of Session variable
-def fix_session_code(path, code):
-    new_path = Path(str(path)+'_')
-    modified = path.stat().st_mtime
-    with Dataset(path) as src:
-        if 'Session' not in src.variables:
-            return False
-        # Find name of dimension and set value of string
-        var_len = 'SessionLen'
-        value = stringtochar(np.array([code], 'S'))
-        with Dataset(new_path, mode='w', format=src.data_model) as trg:
-            # Create the dimensions of the file
-            try:
-                trg.createDimension(var_len, len(code))
-                for name, dim in src.dimensions.items():
-                    if name != var_len:
-                        trg.createDimension(name, len(dim) if not dim.isunlimited() else None)
-            except ValueError as err:
-                raise Problem(f'Could not create dimension: {str(err)}')
-            # Copy the global attributes
-            try:
-                trg.setncatts({a: src.getncattr(a) for a in src.ncattrs()})
-            except ValueError as err:
-                raise Problem(f'Could not copy global attributes in {str(path)}: {str(err)}')
-            # Create the variables in the file
-            for name, var in src.variables.items():
-                try:
-                    trg.createVariable(name, var.dtype, var_len if name == 'Session' else var.dimensions)
-                    # Copy the variable attributes
-                    trg.variables[name].setncatts({a: var.getncattr(a) for a in var.ncattrs()})
-                    # Copy the variables values
-                    trg.variables[name][:] = value if name == 'Session' else src.variables[name][:]
-                except ValueError as err:
-                    raise Problem(f'Could not create {name} variable in {str(path)}: {str(err)}')
-
-    # Set same modified time for new file and overwrite old file
-    shutil.move(new_path, path)
-    os.utime(path, (modified, modified))
+# Need to copy all information and change the dimension of Session variable. New file is written to tmp.
+def fix_session_code(path, code, tmp):
+    var_len = 'SessionLen'
+    try:
+        nc.copy_dataset(path, tmp, patches={'Session': lambda var: nc.to_chars(code)},
+                        dimensions={var_len: len(code)}, variable_dims={'Session': (var_len,)})
+    except ValueError as err:
+        raise Problem(f'Could not copy {str(path)}: {str(err)}')
     return True
 
 
-# Replace session code in text file. Re-write on same file
-def replace_text(path, old_code, new_code):
-    modified = path.stat().st_mtime
-    with open(path, "r+") as f:
-        if found := new_code in (content := re.sub(old_code, new_code, f.read(), re.IGNORECASE)):
-            f.seek(0)
-            f.truncate()
-            f.write(content)
-    os.utime(path, (modified, modified))
-    return found
+# Replace session code in text file. New content is written to tmp.
+def replace_text(path, old_code, new_code, tmp):
+    with open(path, "r", errors='surrogateescape') as f:
+        content = f.read()
+    if not re.search(old_code, content, flags=re.IGNORECASE):
+        return False
+    with open(tmp, "w", errors='surrogateescape') as f:
+        f.write(re.sub(old_code, new_code, content, flags=re.IGNORECASE))
+    return True
 
 
-# Control the modifications in all vgosdb folder.
-def fix_vgosdb_code(path, code):
+# Write modified file in temporary file. Return error message if failed.
+def rewrite_file(path, old_code, code, tmp):
+    try:
+        if path.suffix != '.nc':
+            replace_text(path, old_code, code, tmp)
+        elif len(old_code) == len(code):
+            replace_session_code(path, code, tmp)
+        else:
+            fix_session_code(path, code, tmp)
+        if tmp.exists():
+            modified = path.stat().st_mtime
+            os.utime(tmp, (modified, modified))  # Keep same modified time
+        return None
+    except Problem as err:
+        return str(err)
+    except Exception as err:
+        return f'{str(path)} : {str(err)}'
+
+
+# Replace files by their modified version. Originals are kept as hard links until all files have been replaced
+# so that the vgosDB folder is restored if any replacement fails.
+def commit_files(files, tmps):
+    replaced = []
+    try:
+        for file, tmp in zip(files, tmps):
+            if tmp.exists():
+                os.link(file, backup := Path(f'{str(file)}.bak_'))
+                replaced.append((file, backup))
+                os.replace(tmp, file)
+    except OSError as err:
+        for file, backup in reversed(replaced):
+            os.replace(backup, file)
+            backup.unlink(missing_ok=True)  # Still there if file was not replaced (same inode)
+        for tmp in tmps:
+            tmp.unlink(missing_ok=True)
+        return f'Could not replace files. vgosDB restored : {str(err)}'
+    for _, backup in replaced:
+        backup.unlink()
+    return None
+
+
+# Control the modifications in all vgosdb folder. Files are rewritten in parallel in temporary files
+# and original files are replaced only if all files have been modified.
+def fix_vgosdb_code(path, code, workers=None):
     # Get old code in database.
     if not (head := Path(path, 'Head.nc')).exists():
         print(f'{str(head)} does not exist!')
         return
     with Dataset(head) as nc:
         old_code = nc.variables['Session'][:].tobytes().decode('utf-8')
-    # Decide which function used to repair Session
-    fnc = replace_session_code if len(old_code) == len(code) else fix_session_code
-    try:
-        for file in path.glob('**/*.*'):
-            if file.is_file():
-                fnc(file, code) if file.suffix == '.nc' else replace_text(file, old_code, code)
-    except Problem as err:
+    # Only netCDF files with Session variable are modified
+    files = [file for file in path.glob('**/*.*') if file.is_file() and not file.name.endswith(('.fix_', '.bak_'))]
+    files = [file for file in files if file.suffix != '.nc' or has_session(file)]
+    tmps = [Path(f'{str(file)}.fix_') for file in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        errors = [err for err in pool.map(rewrite_file, files, [old_code] * len(files), [code] * len(files), tmps)
+                  if err]
+    if errors:
+        for tmp in tmps:
+            tmp.unlink(missing_ok=True)
+        print('\n'.join(errors))
+        return
+    if err := commit_files(files, tmps):
         print(err)
 
 
@@ -108,7 +132,8 @@ if __name__ == '__main__':
 
     parser.add_argument('path', help='path of vgosdb folder')
     parser.add_argument('code', help='session code', type=str.upper)
+    parser.add_argument('-w', '--workers', help='number of files processed in parallel', type=int, required=False)
 
     args = parser.parse_args()
 
-    fix_vgosdb_code(Path(args.path), args.code)
+    fix_vgosdb_code(Path(args.path), args.code, args.workers)
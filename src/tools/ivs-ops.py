@@ -1,8 +1,8 @@
+import os
 import re
+import time
 from operator import itemgetter
-
-from email import message_from_bytes
-from _collections import defaultdict
+from collections import defaultdict
 
 from utils import readDICT
 from utils.gmail import Gmail
@@ -26,57 +26,90 @@ from ivsdb import IVSdata
 """
 msg_type = 'ready|start|begin|stop|complete|finish'
 msg_report = 'correlation|analysis'
-
-def extract_ids(subject):
-    title = subject
-    stations = readDICT('/sgpvlbi/progs/adap/config/aliases.toml')
-    words = subject.split()
-    url = app.secret('DataBase', app.args.db)
-
-    found = {}
-    with IVSdata(url) as dbase:
-        ids = dbase.get_sessions_from_names(words)
-        ids.extend(dbase.get_sessions_from_ids(words))
-        subject = re.sub('|'.join(ids), '', subject)
-        codes = re.findall(msg_type, subject)
-        subject = re.sub(msg_type, '', subject)
-        for ses_id in list(set(ids)):
-            ses = dbase.get_session(ses_id)
-            if ses.type == 'intensive':
+ALIASES = '/sgpvlbi/progs/adap/config/aliases.toml'
+
+
+# Clean name the same way subjects are cleaned
+def clean(name):
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+# Match session codes, names and station aliases in subjects of operations messages. Index of sessions and
+# station aliases is kept in memory and reloaded when sessions table or aliases file have changed.
+class SessionMatcher:
+
+    def __init__(self, dbase, aliases=ALIASES, check_interval=300):
+        self.dbase, self.aliases_path, self.check_interval = dbase, aliases, check_interval
+        self.codes, self.names, self.digits, self.sessions = {}, defaultdict(list), defaultdict(list), {}
+        self.stations, self.aliases, self.find_aliases = {}, {}, None
+        self.find_types = re.compile(msg_type).findall
+        self.last_update = self.aliases_time = self.checked = None
+
+    # Build index of all session codes, names and trailing digits of codes
+    def load_sessions(self):
+        codes, names, digits, sessions = {}, defaultdict(list), defaultdict(list), {}
+        for ses in self.dbase.get_session_rows():
+            code = ses.code.lower()
+            codes[code] = sessions[code] = ses
+            names[clean(ses.name)].append(code)
+            if (number := re.search(r'\d+$', code)) and len(number := number.group()) > 4:
+                for index in range(len(number) - 4):
+                    digits[number[index:]].append(code)
+        self.codes, self.names, self.digits, self.sessions = codes, names, digits, sessions
+
+    # Compile one regex for all station aliases. Longest aliases are tested first.
+    def load_aliases(self):
+        stations, aliases = readDICT(self.aliases_path), {}
+        for sta_id, station in stations.items():
+            for alias in station['aliases']:
+                aliases.setdefault(alias.lower(), sta_id.lower())
+        self.stations = {sta_id.lower(): station for sta_id, station in stations.items()}
+        self.aliases = aliases
+        pattern = '|'.join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True))
+        self.find_aliases = re.compile(pattern).finditer if pattern else lambda text: iter(())
+
+    # Reload index if sessions, session stations or aliases have been updated since last check
+    def refresh(self):
+        if self.checked and time.time() - self.checked < self.check_interval:
+            return
+        self.checked = time.time()
+        if (last_update := self.dbase.get_last_session_update()) != self.last_update or not self.codes:
+            self.load_sessions()
+            self.last_update = last_update
+        if (modified := os.stat(self.aliases_path).st_mtime) != self.aliases_time:
+            self.load_aliases()
+            self.aliases_time = modified
+
+    # Find sessions in words of subject. Same order of tests than old database queries.
+    def find_sessions(self, words):
+        if ses_ids := [word for word in words if word in self.codes]:
+            return ses_ids
+        if ses_ids := [word[:-2] for word in words if word[-2:] in self.stations and word[:-2] in self.codes]:
+            return ses_ids
+        if ses_ids := [code for word in words for code in self.names.get(word, [])]:
+            return ses_ids
+        return [code for word in words if len(number := re.sub(r'[^0-9]', '', word)) > 4
+                for code in self.digits.get(number, [])]
+
+    # Return type of messages and stations for each session in subject (already cleaned)
+    def classify(self, subject):
+        self.refresh()
+        words = subject.split()
+        found = {}
+        for ses_id in dict.fromkeys(self.find_sessions(words)):
+            ses = self.sessions[ses_id]
+            if ses.is_intensive:
                 found[ses_id] = {'codes': ['INT']}
                 continue
-            network = [get(sta_id.capitalize(), None) for sta_id in ses.stations]
-            network = sorted(network, key=itemgetter('order', 'code'))
-            lst = []
-            for station in network:
-                for alias in station['aliases']:
-                    if alias in subject:
-                        lst.append(station['code'])
-                        subject = subject.replace(alias, '')
-                        break
-            found[ses_id] = {'codes': codes, 'stations': lst}
-
-    return found
-
-def test_digits():
-    msg = '11021 128 41021'
-    url = app.secret('DataBase', app.args.db)
-    with IVSdata(url) as dbase:
-        for word in re.findall('[0-9]+', msg):
-            if len(word) > 2:
-                ids = [code for code in dbase.get_sessions_from_digits(f'%{word}') if re.match(f'[a-zA-Z]+{word}',code)]
-                print(word, ids)
-
-
-def get_session(dbase, subject, sta_list):
-    words = subject.split()
-    if not (ses_ids := dbase.get_sessions_from_ids(words)):
-        ses_ids = dbase.get_sessions_from_ids([w[:-2] for w in words if w.endswith(sta_list)])
-    if not ses_ids:
-        ses_ids = dbase.get_sessions_from_names(words)
-    if not ses_ids and (digits := [f'%{w1}' for w in words if (w1 := re.sub(r'[^0-9 ]', '', w)) and len(w1) > 4]):
-        ses_ids = dbase.get_sessions_from_digits(digits)
-    return ses_ids
+            text = ' '.join(word for word in words if word != ses_id)
+            network = {sta_id.lower() for sta_id in ses.stations}
+            stations = []
+            for match in self.find_aliases(text):
+                if (sta_id := self.aliases[match.group()]) in network and sta_id not in stations:
+                    stations.append(sta_id)
+            network = sorted([self.stations[sta_id] for sta_id in stations], key=itemgetter('order', 'code'))
+            found[ses_id] = {'codes': self.find_types(text), 'stations': [station['code'] for station in network]}
+        return found
 
 
 def is_valid_message(msg):
@@ -101,43 +134,39 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--db', help='database name', default='ivscc', required=False)
     parser.add_argument('-a', '--account', help='gmail account', default='ivsop', required=False)
     parser.add_argument('-l', '--labels', help='label name', default=['INBOX'], nargs='+', required=False)
+    parser.add_argument('-m', '--mark', help='label and mark INBOX messages as read', action='store_true',
+                        required=False)
     parser.add_argument('filters', help='filters to apply', nargs='+')
 
     args = app.init(parser.parse_args())
 
     credentials = '/sgpvlbi/progs/config/adap/ivsop-1.json'
-    stations = readDICT('/sgpvlbi/progs/config/adap/stations.toml')
-    sta_list = tuple([sta.lower() for sta in list(stations.keys())])
-
     print(args.labels)
 
     db_url, tunnel = app.get_dbase_info()
     with IVSdata(db_url, tunnel) as dbase, Gmail(credentials) as gmail:
         isOPS, notOPS = gmail.labels['IVS-ops'], gmail.labels['NOT-ops']
-        sessions = defaultdict(list)
+        matcher = SessionMatcher(dbase)
+        nbr_messages, elapsed = 0, 0
         for name in args.labels:
             label = gmail.labels.get(name, 'INBOX')
             for uid in gmail.get_uids([label], filters=args.filters):
                 msg = gmail.get_msg(uid)
+                t0 = time.time()
                 valid, subject = is_valid_message(msg)
-                if subject and (ids := get_session(dbase, subject, sta_list)):
-                    [subject for ses_id in ids if (subject := subject.replace(ses_id, ''))]
-                    [sessions[id].append(subject) for id in ids]
-                continue
-                flags = [isOPS] if valid else [notOPS]
+                found = matcher.classify(subject) if subject else {}
+                elapsed, nbr_messages = elapsed + time.time() - t0, nbr_messages + 1
 
-                if label == 'INBOX':
-                    gmail.mark_as_read(uid, flags=flags)
+                if args.mark and label == 'INBOX':
+                    gmail.mark_as_read(uid, flags=[isOPS] if valid else [notOPS])
                 if subject:
-                    if found := extract_ids(subject):
-                        for ses_id, info in found.items():
-                            if 'INT' in info['codes']:
-                                print(f'{ses_id} is intensive')
-                            else:
-                                print(f'{ses_id} {info["codes"]} {info["stations"]} {uid}')
-                    else:
+                    if not found:
                         print('No session found')
-
-    for id, subjects in sessions.items():
-        [print(id, subject) for subject in subjects]
-
+                    for ses_id, info in found.items():
+                        if 'INT' in info['codes']:
+                            print(f'{ses_id} is intensive')
+                        else:
+                            print(f'{ses_id} {info["codes"]} {info["stations"]} {uid}')
+
+    if nbr_messages:
+        print(f'{nbr_messages} messages classified in {elapsed:.3f} seconds')
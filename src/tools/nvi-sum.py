@@ -18,12 +18,11 @@ def make_summary(stations):
     legacy = defaultdict(list)
 
     dbase = app.get_dbase()
-    for ses_id in dbase.get_sessions(start, end, ['standard', 'intensive']):
-        if session := dbase.get_session(ses_id):
-            for sta_id in stations:
-                if sta_id in session.included:
-                    sessions = vgos if session.name.startswith('vgos') else legacy
-                    sessions[sta_id].append(ses_id.upper())
+    for session in dbase.get_session_rows(start, end, ['standard', 'intensive']):
+        for sta_id in stations:
+            if sta_id in session.included:
+                sessions = vgos if session.name.startswith('vgos') else legacy
+                sessions[sta_id].append(session.code.upper())
 
     for sta_id in stations:
         if sta_id in vgos:
@@ -1,95 +1,204 @@
 import re
+import os
+import hashlib
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import gzip
 
-from utils import app, to_float
+from utils import app, to_float, readDICT, saveDICT
 from ivsdb import IVSdata
 from ivsdb.models import SessionStation, SEFD, Detector
 
+is_header = re.compile(r'^(?P<time>^\d{4}\.\d{3}\.\d{2}:\d{2}:\d{2}\.\d{2})(?P<key>#onoff#    source)'
+                       r'(?P<data>.*)$').match
+is_onoff = re.compile(r'^(?P<time>^\d{4}\.\d{3}\.\d{2}:\d{2}:\d{2}\.\d{2})(?P<key>#onoff#VAL)'
+                      r'(?P<data>.*)$').match
+
+TAIL = 4096  # Number of bytes used to validate that a log has only been appended
+
+
+# Make SEFD record (with detectors) using onoff records
+def make_sefd(station, data):
+    common_data = data[0]
+    source, observed = common_data['source'], common_data['time']
+
+    sefd = SEFD(station=station, source=source, observed=observed)
+    sefd.station, sefd.source, sefd.observed = station, source, observed
+    sefd.azimuth = common_data['Az']
+    sefd.elevation = common_data['El']
+
+    for value in data:
+        detector = Detector()
+        detector.id = sefd.id
+        detector.device = value['De']
+        detector.input = int(value['I'])
+        detector.frequency = to_float(value['Center'])
+        detector.polarization = value['P']
+        detector.gain_compression = to_float(value['Comp'])
+        detector.tsys = to_float(value['Tsys'])
+        detector.sefd = to_float(value['SEFD'])
+        detector.tcal_j = to_float(value['Tcal(j)'])
+        detector.tcal_r = to_float(value['Tcal(r)'])
+        sefd.detectors.append(detector)
+    return sefd
+
 
 def save_sefd(csv, station, data):
     if not data:
         return False
     try:
-        common_data = data[0]
-        source, observed = common_data['source'], common_data['time']
-
-        sefd = SEFD(station=station, source=source, observed=observed)
-        sefd.station, sefd.source, sefd.observed = station, source, observed
-        sefd.azimuth = common_data['Az']
-        sefd.elevation = common_data['El']
-
-        for value in data:
-            detector = Detector()
-            detector.id = sefd.id
-            detector.device = value['De']
-            detector.input = int(value['I'])
-            detector.frequency = to_float(value['Center'])
-            detector.polarization = value['P']
-            detector.gain_compression = to_float(value['Comp'])
-            detector.tsys = to_float(value['Tsys'])
-            detector.sefd = to_float(value['SEFD'])
-            detector.tcal_j = to_float(value['Tcal(j)'])
-            detector.tcal_r = to_float(value['Tcal(r)'])
-            sefd.detectors.append(detector)
-        print(sefd.to_csv(), file=csv)
+        print(make_sefd(station, data).to_csv(), file=csv)
         return True
     except:
         return False
 
 
-def get_onoff(csv, sta_id, path):
-    is_header = re.compile(r'^(?P<time>^\d{4}\.\d{3}\.\d{2}:\d{2}:\d{2}\.\d{2})(?P<key>#onoff#    source)'
-                           r'(?P<data>.*)$').match
-    is_onoff = re.compile(r'^(?P<time>^\d{4}\.\d{3}\.\d{2}:\d{2}:\d{2}\.\d{2})(?P<key>#onoff#VAL)'
-                          r'(?P<data>.*)$').match
-
-    nbr, header, records = 0, [], []
-    with open(path, 'r', encoding="utf8", errors="ignore") as f:
-        for line in f:
+# Compute md5 of the bytes preceding offset
+def tail_digest(file, offset):
+    file.seek(max(0, offset - TAIL))
+    return hashlib.md5(file.read(offset - file.tell())).hexdigest()
+
+
+# Read onoff records added to log since last checkpoint. Executed in worker process.
+def read_onoff(path, checkpoint):
+    stat = os.stat(path)
+    if checkpoint and checkpoint['mtime'] == stat.st_mtime and checkpoint['offset'] == stat.st_size:
+        return path, checkpoint, [], False  # Nothing new
+
+    groups, header, records, reset, closed = [], checkpoint.get('header', []), [], False, False
+    with open(path, 'rb') as f:
+        offset = checkpoint.get('offset', 0)
+        # Log has been replaced or truncated. Read everything again
+        if offset and (offset > stat.st_size or tail_digest(f, offset) != checkpoint.get('digest', '')):
+            offset, header, reset = 0, [], True
+        f.seek(offset)
+        group_start = offset
+        for raw in iter(f.readline, b''):
+            if not raw.endswith(b'\n'):
+                break  # Partial line. Will be read next time
+            line_start, offset = offset, offset + len(raw)
+            line = raw.decode('utf8', errors='ignore')
             if found := is_onoff(line):
                 timestamp = datetime.strptime(found['time'], '%Y.%j.%H:%M:%S.%f')
                 record = {name: value for name, value in zip(header, found['data'].split())}
                 records.append(dict(**{'time': timestamp}, **record))
+                closed = False
             elif found := is_header(line):
                 header = ['source'] + found['data'].split()
-                nbr += save_sefd(csv, sta_id, records)  # Send existing onoff records to VCC
-                records = []
+                if records:
+                    groups.append(records)
+                records, group_start, closed = [], line_start, False
+            elif '#onoff#' not in line:
+                closed = True  # Other log line after onoff records. Group is complete
+        if records:
+            if closed:
+                groups.append(records)
+            else:  # Log may still be writing this group. Read it again from its header next time
+                offset = group_start
+        digest = tail_digest(f, offset)
+
+    observed = [group[0]['time'] for group in groups]
+    first, last = (min(observed), max(observed)) if observed else (None, None)
+    if not reset and checkpoint.get('first'):
+        first = min(first, datetime.fromisoformat(checkpoint['first'])) if first \
+            else datetime.fromisoformat(checkpoint['first'])
+        last = max(last, datetime.fromisoformat(checkpoint['last'])) if last \
+            else datetime.fromisoformat(checkpoint['last'])
+    checkpoint = dict(offset=offset, mtime=stat.st_mtime, digest=digest, header=header,
+                      first=first.isoformat() if first else '', last=last.isoformat() if last else '')
+    return path, checkpoint, groups, reset
+
+
+# Extract SEFDs from log files that have changed since last run and store them in database
+class SEFDextractor:
+
+    def __init__(self, dbase, path, workers=None):
+        self.dbase, self.path, self.workers = dbase, os.path.expanduser(path), workers
+        self.checkpoints = readDICT(self.path) if os.path.exists(self.path) else {}
+        self.failed = {}
+
+    def save(self):
+        saveDICT(self.path, self.checkpoints)
+
+    # Get list of (station, log path) for all sessions with this station
+    def get_logs(self, sta_id):
+        for (ses_id,) in self.dbase.orm_ses.query(SessionStation.session).filter(SessionStation.station == sta_id).all():
+            if (session := self.dbase.get_session(ses_id)) and (log := session.log_path(sta_id)).exists():
+                yield str(log)
+
+    # Remove SEFDs previously extracted from a log that has been replaced
+    def clean(self, sta_id, checkpoint):
+        if checkpoint.get('first'):
+            self.dbase.orm_ses.query(SEFD).filter(SEFD.station == sta_id).filter(
+                SEFD.observed.between(checkpoint['first'], checkpoint['last'])).delete(synchronize_session=False)
+
+    def execute(self, stations, csv=None):
+        logs = {path: sta_id for sta_id in stations for path in self.get_logs(sta_id)}
+        extracted, self.failed = dict.fromkeys(stations, 0), {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(read_onoff, path, self.checkpoints.get(path, {})): path for path in logs}
+            for future, path in futures.items():
+                try:
+                    path, checkpoint, groups, reset = future.result()
+                except Exception as exc:  # Unreadable log or worker died. Checkpoint is not changed
+                    self.failed[path] = f'read failed [{str(exc)}]'
+                    print(f'{os.path.basename(path)} {self.failed[path]}')
+                    continue
+                sta_id = logs[path]
+                try:
+                    if reset:
+                        self.clean(sta_id, self.checkpoints.get(path, {}))
+                    sefds = [make_sefd(sta_id, group) for group in groups]
+                    self.dbase.orm_ses.add_all(sefds)
+                    self.dbase.commit()
+                except Exception as exc:
+                    self.dbase.rollback()
+                    self.failed[path] = f'failed [{str(exc)}]'
+                    print(f'{os.path.basename(path)} {self.failed[path]}')
+                    continue
+                if csv:
+                    for sefd in sefds:
+                        print(sefd.to_csv(), file=csv)
+                self.checkpoints[path] = checkpoint
+                extracted[sta_id] += len(sefds)
+        self.save()
+        return extracted
+
 
+def get_onoff(csv, sta_id, path):
+    nbr = 0
+    for records in read_onoff(path, {})[2]:
         nbr += save_sefd(csv, sta_id, records)
-        return nbr
+    return nbr
 
 
 if __name__ == '__main__':
     import argparse
     from pathlib import Path
-    import os
 
-    from utils import readDICT
     from utils.mail import send_message, build_message
 
     parser = argparse.ArgumentParser(description='Extract SEFDs from logs')
     parser.add_argument('-c', '--config', help='config file', required=True)
     parser.add_argument('-d', '--db', help='database name', default='ivscc', required=False)
+    parser.add_argument('-w', '--workers', help='number of processes reading logs', type=int, required=False)
 
     app.init(parser.parse_args())
 
     url, tunnel = app.get_dbase_info()
-    vgos = dict(Gs=0, K2=0, Mg=0, Nn=0, Oe=0, Ow=0, Sa=0, Wf=0, Ws=0, Yj=0)
-    mixed = dict(Hb=0, Is=0)
+    vgos = ['Gs', 'K2', 'Mg', 'Nn', 'Oe', 'Ow', 'Sa', 'Wf', 'Ws', 'Yj']
+    mixed = ['Hb', 'Is']
 
+    details = readDICT(Path(os.environ['CONFIG_DIR'], 'sefd.toml'))
     today = datetime.now().strftime("%Y-%m-%d")
     name = f'/tmp/sefd-{today}.csv.gz'
     with IVSdata(url, tunnel) as dbase, gzip.open(name, 'wt') as csv:
-        for sta_id, nbr in vgos.items():
-            for (ses_id,) in dbase.orm_ses.query(SessionStation.session).filter(SessionStation.station == sta_id).all():
-                if (session := dbase.get_session(ses_id)) and (log := session.log_path(sta_id)).exists():
-                    nbr += get_onoff(csv, sta_id, log)
-            vgos[sta_id] = nbr
-
-    # Email file
-    message = f'VGOS stations  {",".join([sta_id for sta_id, nbr in vgos.items()])}'
-    details = readDICT(Path(os.environ['CONFIG_DIR'], 'sefd.toml'))
+        extractor = SEFDextractor(dbase, details.get('checkpoints', '~/.sefd-checkpoints.json'), app.args.workers)
+        extracted = extractor.execute([sta_id.lower() for sta_id in vgos], csv)
+
+    # Email file with new SEFDs
+    message = '\n'.join([f'{sta_id.capitalize()} {nbr} new SEFDs' for sta_id, nbr in extracted.items()]
+                        + [f'{os.path.basename(path)} {err}' for path, err in extractor.failed.items()])
     msg = build_message(details['sender'], details['recipients'], f'SEFDs for vgos stations {today}',
                         reply=details['reply'], text=message, files=[str(name)])
     send_message(details['server'], msg)
@@ -1,36 +1,30 @@
 import os
-from pathlib import Path
 
 from utils import app
+from vgosdb.catalog import VGOScatalog
 
 class VGOSDBstatus:
 
     def __init__(self):
-        pass
+        self.catalog = VGOScatalog()
 
     def check_masters(self):
         for year in range(1979, 2022):
             path = os.path.join(app.VLBIfolders.control, f'master{year%100:02d}.txt')
             print(path, os.path.exists(path))
 
-    def get_vgosdb(self, pattern):
-        # Define time limits and pattern to find files
-        found = set()
-        # Find all vgosdb wrappers that have been updated during that period
-        root = app.VLBIfolders.vgosdb
-        for year in os.listdir(root):
-            if year.isdigit():
-                folder = os.path.join(root, year)
-                for file in Path(folder).glob(pattern):
-                    found.add(file.parts[-2][:9])
-        return found
+    # Get vgosdb having wrapper with specific version, agency and subset (from catalog)
+    def get_vgosdb(self, **kwargs):
+        return {db_name[:9] for db_name in self.catalog.find(**kwargs)}
 
     def get_non_analyzed(self):
-        downloaded = self.get_vgosdb('*/Head.nc')
+        # Make sure catalog is up-to-date
+        self.catalog.scan()
+        downloaded = {db_name[:9] for db_name in self.catalog.with_head()}
         print('Downloaded', len(downloaded))
-        analyzed = self.get_vgosdb('*/*GSF*kall.wrp')
+        analyzed = self.get_vgosdb(agency='GSFC', subset='all')
         print('Analyzed', len(analyzed))
-        old = self.get_vgosdb('*/*V001*iIVS*wrp') | self.get_vgosdb('*/*iIVS_kngs.wrp')
+        old = self.get_vgosdb(version='V001', agency='IVS') | self.get_vgosdb(agency='IVS', subset='ngs')
         print('Correlated', len(old))
         downloaded -= old
         analyzed -= old
@@ -38,7 +32,7 @@ class VGOSDBstatus:
             print('Non-analyzed', ses_id)
         for ses_id in (analyzed - downloaded):
             print('No head', ses_id)
-        test = self.get_vgosdb('*/*iIVS_kngs.wrp')
+        test = self.get_vgosdb(agency='IVS', subset='ngs')
         print(len(test), len((downloaded - analyzed) - test))
 
 if __name__ == '__main__':
@@ -6,7 +6,7 @@ from datetime import datetime
 from subprocess import Popen, PIPE
 
 from utils import readDICT
-from utils.mail import send_message, build_message
+from utils.mail import queue_message, build_message
 
 args = Applications = ControlFiles = Tunnel = None
 _dbase = None
@@ -96,7 +96,7 @@ def notify(title, message, extra=""):
         message = f"{message}\n\n{extra}" if extra else message
         details = info['Notifications']
         msg = build_message(details['sender'], details['recipients'], title, text=message)
-        send_message(details['server'], msg)
+        queue_message(details['server'], msg)
 
 
 # Create database generator
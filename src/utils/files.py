@@ -1,6 +1,8 @@
 from datetime import datetime
 import unicodedata
 import hashlib
+import sqlite3
+import json
 import os
 import re
 import stat
@@ -105,6 +107,48 @@ def get_md5sum(path, chunk_size=32768):
     return md5.hexdigest()
 
 
+# Cache md5 and remote fingerprint of local files. Entries are valid while size and mtime of local file are unchanged.
+class DigestCache:
+
+    def __init__(self, path):
+        self.con = sqlite3.connect(os.path.expanduser(path), timeout=30)
+        self.con.execute("CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                         "md5 TEXT, remote TEXT)")
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    # Get cached record if it is still valid for local file
+    def get(self, path):
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        row = self.con.execute("SELECT size, mtime, md5, remote FROM digests WHERE path = ?", (str(path),)).fetchone()
+        if row and row[0] == info.st_size and row[1] == info.st_mtime:
+            return {'md5': row[2], 'remote': json.loads(row[3]) if row[3] else None}
+        return None
+
+    # Store md5 and remote fingerprint for local file
+    def set(self, path, md5, remote=None):
+        info = os.stat(path)
+        self.con.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)",
+                         (str(path), info.st_size, info.st_mtime, md5, json.dumps(remote) if remote else None))
+        self.con.commit()
+
+    # Get md5 of local file. Computed only if not in cache.
+    def md5(self, path):
+        if record := self.get(path):
+            return record['md5']
+        self.set(path, md5 := get_md5sum(path), None)
+        return md5
+
+    # Get fingerprint of remote file when local file was downloaded
+    def remote(self, path):
+        return record['remote'] if (record := self.get(path)) else None
+
+
 def remove(path):
     try:
         if os.path.exists(path):
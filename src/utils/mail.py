@@ -3,6 +3,12 @@ import re
 import os
 import socket
 import traceback
+import time
+import queue
+import atexit
+import hashlib
+import threading
+from datetime import datetime
 
 from utils import readDICT
 from googleapiclient.discovery import build
@@ -17,35 +23,181 @@ from email.header import Header
 import mimetypes
 
 
-def send_gmail(credentials, msg):
-    creds = Storage(credentials).get()
-    service = build('gmail', 'v1', http=creds.authorize(Http()), cache_discovery=False) if creds else None
-    try:
-        body = {'raw': base64.urlsafe_b64encode(msg.as_bytes()).decode()}
-        service.users().messages().send(userId='me', body=body).execute()
-        return ''
-    # except errors.HttpError, error:
-    except Exception as exc:
-        return f'Error sending email {str(exc)}'
+# Stand-in for SMTP server writing messages in a local folder. Used when server is local:folder
+class LocalSMTP:
+    def __init__(self, folder):
+        self.folder = os.path.expanduser(folder)
+        os.makedirs(self.folder, exist_ok=True)
 
+    def noop(self):
+        return 250, b'OK'
 
-def send_smtp(server, msg):
-    try:
-        smpt = smtplib.SMTP(server)
+    def sendmail(self, sender, recipients, text):
+        name = f'{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}.eml'
+        with open(os.path.join(self.folder, name), 'w') as f:
+            f.write(f'X-Envelope-From: {sender}\nX-Envelope-To: {", ".join(recipients)}\n{text}')
+        return {}
+
+    def quit(self):
+        pass
+
+
+# Keep connections to SMTP servers and Gmail services alive between messages.
+# Failed messages are sent again after a delay that doubles after each try.
+class MailTransport:
+    Tries, Delay, Timeout = 3, 2, 30
+
+    def __init__(self):
+        self.smtp, self.gmail = {}, {}
+        self.lock = threading.Lock()
+
+    # Get SMTP connection. New connection if not connected or not responding.
+    def get_smtp(self, server):
+        if smtp := self.smtp.get(server):
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except Exception:
+                pass
+            self.drop(server)
+        smtp = LocalSMTP(server.split(':', 1)[-1]) if server.startswith('local:') else smtplib.SMTP(server, timeout=self.Timeout)
+        self.smtp[server] = smtp
+        return smtp
+
+    # Get Gmail service. Reloaded if credentials have been modified.
+    def get_gmail(self, credentials):
+        modified = os.path.getmtime(credentials)
+        if (info := self.gmail.get(credentials)) and info[0] == modified:
+            return info[1]
+        creds = Storage(credentials).get()
+        service = build('gmail', 'v1', http=creds.authorize(Http()), cache_discovery=False) if creds else None
+        self.gmail[credentials] = (modified, service)
+        return service
+
+    # Close connection or remove service for this server
+    def drop(self, server):
+        if smtp := self.smtp.pop(server, None):
+            try:
+                smtp.quit()
+            except Exception:
+                pass
+        self.gmail.pop(server.split(':', 1)[-1], None)
+
+    def send_gmail(self, credentials, msg):
+        body = {'raw': base64.urlsafe_b64encode(msg.as_bytes()).decode()}
+        self.get_gmail(credentials).users().messages().send(userId='me', body=body).execute()
+
+    def send_smtp(self, server, msg):
         contact = re.match("(?P<name>.*)<(?P<address>.*)>$", msg['From'])
         sender = contact["address"] if contact else msg['From']
-        smpt.sendmail(sender, list(map(str.strip, msg['To'].split(','))), msg.as_string())
-        smpt.quit()
-        return ''
-    except Exception as err:
-        return f'Error sending email {str(err)}'
+        recipients = [addr.strip() for field in ('To', 'Cc') for addr in (msg[field] or '').split(',') if addr.strip()]
+        self.get_smtp(server).sendmail(sender, recipients, msg.as_string())
+
+    # Send message and return error message (empty if ok)
+    def send(self, server, msg):
+        delay, err = self.Delay, ''
+        for attempt in range(self.Tries):
+            try:
+                with self.lock:
+                    if server.startswith('gmail'):
+                        self.send_gmail(server.split(':', 1)[-1], msg)
+                    else:
+                        self.send_smtp(server, msg)
+                return ''
+            except Exception as exc:
+                err = f'Error sending email {str(exc)}'
+                with self.lock:
+                    self.drop(server)
+            if attempt < self.Tries - 1:
+                time.sleep(delay)
+                delay *= 2
+        return err
+
+    # Close all connections
+    def close(self):
+        with self.lock:
+            for server in list(self.smtp.keys()):
+                self.drop(server)
+            self.gmail = {}
+
+
+# Queue of messages sent by a background thread. Same message sent to same recipients within window is sent once.
+# Errors are reported using on_error function of message or of queue.
+class MailQueue:
 
+    def __init__(self, transport, window=300, on_error=None):
+        self.transport, self.window, self.on_error = transport, window, on_error
+        self.queue, self.sent = queue.Queue(), {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
 
+    # Make key using server, recipients, subject and text of message
+    @staticmethod
+    def make_key(server, msg):
+        md5 = hashlib.md5(f'{server}|{msg["To"]}|{msg["Cc"]}|{msg["Subject"]}'.encode('utf-8'))
+        for part in msg.walk():
+            if not part.is_multipart():
+                md5.update(part.get_payload(decode=True) or b'')
+        return md5.hexdigest()
+
+    # Add message to queue. Return False if same message was queued within window.
+    def put(self, server, msg, on_error=None):
+        key, now = self.make_key(server, msg), time.time()
+        with self.lock:
+            self.sent = {k: t for k, t in self.sent.items() if now - t < self.window}
+            if key in self.sent:
+                return False
+            self.sent[key] = now
+        self.queue.put((server, msg, on_error if on_error else self.on_error))
+        return True
+
+    # Send messages in queue
+    def run(self):
+        while (item := self.queue.get()) is not None:
+            server, msg, on_error = item
+            try:
+                if (err := self.transport.send(server, msg)) and on_error:
+                    on_error(err)
+            finally:
+                self.queue.task_done()
+        self.queue.task_done()
+
+    # Wait until all messages have been sent
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+
+Transport = MailTransport()
+_mail_queue = None
+
+
+def send_gmail(credentials, msg):
+    return Transport.send(f'gmail:{credentials}', msg)
+
+
+def send_smtp(server, msg):
+    return Transport.send(server, msg)
+
+
+# Send message using persistent connection. Return error message.
 def send_message(server, msg):
-    if server.startswith('gmail'):
-        return send_gmail(server.split(':', 1)[-1], msg)
-    else:
-        return send_smtp(server, msg)
+    return Transport.send(server, msg)
+
+
+# Queue message to be sent by background thread. Duplicate messages within window are not sent and False is returned.
+# on_error is called with error message if message could not be sent.
+def queue_message(server, msg, window=300, on_error=None):
+    global _mail_queue
+    if not _mail_queue:
+        _mail_queue = MailQueue(Transport, window, on_error=lambda err: print(err))
+        atexit.register(_mail_queue.close)
+    return _mail_queue.put(server, msg, on_error)
 
 
 # Send more complex emails.
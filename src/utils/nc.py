@@ -1,10 +1,28 @@
 from pathlib import Path
+import os
 import re
 
 from netCDF4 import Dataset, stringtochar
 import numpy as np
 
 do_not_check = set(['CreateTime', 'CreatedBy'])
+CHUNK = 1000000  # Maximum number of values read at once
+
+
+# Slices of first dimension covering at most CHUNK values
+def blocks(var, chunk=CHUNK):
+    if var.ndim == 0 or var.size <= chunk:
+        yield Ellipsis
+        return
+    step = max(1, chunk // max(1, var.size // var.shape[0]))
+    for start in range(0, var.shape[0], step):
+        yield slice(start, start + step)
+
+
+# Copy values of variable by blocks of first dimension
+def copy_values(src, trg, chunk=CHUNK):
+    for block in blocks(src, chunk):
+        trg[block] = src[block]
 
 
 def same(first, second):
@@ -16,14 +34,65 @@ def same(first, second):
         if keys_1 != keys_2:
             return False
         for key in keys_1:
-            if key not in do_not_check and not np.array_equal(nc1.variables[key][:], nc2.variables[key][:]):
+            if key in do_not_check:
+                continue
+            var1, var2 = nc1.variables[key], nc2.variables[key]
+            if var1.shape != var2.shape:
                 return False
+            for block in blocks(var1):
+                if not np.array_equal(var1[block], var2[block]):
+                    return False
     return True
 
 
+# Encode string as netCDF char array
+def to_chars(text):
+    return stringtochar(np.array([text], 'S'))
+
+
+# Keep modified time of file after calling function
+def keep_mtime(path, function, *args):
+    modified = os.stat(path).st_mtime
+    result = function(*args)
+    os.utime(path, (modified, modified))
+    return result
+
+
+# Write new values in existing variables. Values have same shape than variables.
+def patch_dataset(path, values, preserve_mtime=False):
+    def patch():
+        with Dataset(path, mode='r+') as nc:
+            for name, value in values.items():
+                nc.variables[name][:] = value
+    keep_mtime(path, patch) if preserve_mtime else patch()
+
+
+# Copy netCDF file by blocks. Dimensions could be added or resized, variables could use other dimensions and
+# some variables replaced using patches (name: function returning new values from source variable).
+def copy_dataset(src_path, dst_path, patches=None, dimensions=None, variable_dims=None, preserve_mtime=True):
+    patches, dimensions, variable_dims = patches or {}, dimensions or {}, variable_dims or {}
+    with Dataset(src_path) as src, Dataset(dst_path, mode='w', format=src.data_model) as trg:
+        for name, dim in src.dimensions.items():
+            trg.createDimension(name, dimensions.get(name, None if dim.isunlimited() else len(dim)))
+        for name in dimensions.keys() - src.dimensions.keys():
+            trg.createDimension(name, dimensions[name])
+        trg.setncatts({a: src.getncattr(a) for a in src.ncattrs()})
+        for name, var in src.variables.items():
+            attrs = {a: var.getncattr(a) for a in var.ncattrs()}
+            fill_value = attrs.pop('_FillValue', None)
+            new = trg.createVariable(name, var.dtype, variable_dims.get(name, var.dimensions), fill_value=fill_value)
+            new.setncatts(attrs)
+            if name in patches:
+                new[:] = patches[name](var)
+            else:
+                copy_values(var, new)
+    if preserve_mtime:
+        modified = os.stat(src_path).st_mtime
+        os.utime(dst_path, (modified, modified))
+
+
 def update_create_time(path, utc):
-    with Dataset(path, mode='r+') as f:
-        f.variables['CreateTime'][:] = stringtochar(np.array([utc.strftime('%Y/%m/%d %H:%M:%S UTC')], 'S'))
+    patch_dataset(path, {'CreateTime': to_chars(utc.strftime('%Y/%m/%d %H:%M:%S UTC'))})
 
 
 def version(path):
@@ -46,6 +115,7 @@ if __name__ == '__main__':
 
     parser.add_argument('-s', '--same', help='test if 2 files are same', nargs=2, required=False)
     parser.add_argument('-u', '--update', help='update create time', nargs='+', required=False)
+    parser.add_argument('-c', '--copy', help='copy file by blocks and print elapsed time', nargs=2, required=False)
 
     args = parser.parse_args()
 
@@ -55,3 +125,8 @@ if __name__ == '__main__':
         path, utc = args.update if len(args.update) == 2 else (args.update[0], 'now')
         utc = datetime.utcnow() if utc == 'now' else datetime.fromisoformat(utc)
         update_create_time(path, utc)
+    elif args.copy:
+        import time
+        t0 = time.time()
+        copy_dataset(*args.copy)
+        print(f'{args.copy[0]} copied in {time.time() - t0:.3f} seconds')
@@ -1,10 +1,13 @@
 import os
+import shutil
 import ssl
 import re
 import time
 import traceback
 import subprocess
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from email.utils import formatdate
 
 from ftplib import FTP_TLS, FTP
 from urllib.parse import urljoin
@@ -28,6 +31,17 @@ last_mod_time = None
 
 scale_bytes = {'KB': float(1024), 'MB': float(1024 * 1024), 'GB': float(1024 * 1024 * 1024)}
 
+NOT_MODIFIED = 'not modified'
+
+
+# Compare fingerprints (size, mtime, etag) of remote file. Unknown values are never considered same.
+def same_fingerprint(old, new):
+    if not old or not new:
+        return False
+    if old.get('etag') and new.get('etag'):
+        return old['etag'] == new['etag']
+    return bool(new.get('mtime')) and old.get('mtime') == new['mtime'] and old.get('size') == new.get('size')
+
 
 # HTTPAdapter to lower cypher level so that some https servers could be accessed
 class TLSAdapter(HTTPAdapter):
@@ -139,6 +153,16 @@ class FTPserver:
             pass
         self.connected = False
 
+    # Test that connection is still usable (server may close idle connections)
+    def is_alive(self):
+        if not self.connected:
+            return False
+        try:
+            self.host.voidcmd('NOOP')
+            return True
+        except Exception:
+            return False
+
     # Upload file to ivs center (This is specific to each server)
     def no_upload(self, lst, testing=False):
         self.add_error(f'cannot upload to {self.code}')
@@ -223,6 +247,31 @@ class FTPserver:
             self.add_error('download {} failed : [{}]'.format(rpath, str(err)))
             return False, self.errors
 
+    # Get size and modified time of remote file using SIZE and MDTM commands
+    def get_fingerprint(self, rpath):
+        info = dict(size=None, mtime=None, etag=None)
+        if not self.is_connected:
+            return info
+        try:
+            self.host.voidcmd('TYPE I')  # SIZE is not accepted in ASCII mode by some servers
+            info['size'] = self.host.size(rpath)
+        except Exception:
+            pass
+        try:
+            text = self.host.sendcmd(f'MDTM {rpath}').split()[-1][:14]
+            info['mtime'] = int(pytz.UTC.localize(datetime.strptime(text, '%Y%m%d%H%M%S')).timestamp())
+        except Exception:
+            pass
+        return info
+
+    # Download file only if remote fingerprint is different from the one provided.
+    # Return ok, md5 (or NOT_MODIFIED or errors) and fingerprint of remote file
+    def conditional_download(self, rpath, lpath, fingerprint=None):
+        if same_fingerprint(fingerprint, remote := self.get_fingerprint(rpath)):
+            return False, NOT_MODIFIED, remote
+        ok, info = self.download(rpath, lpath)
+        return ok, info, remote
+
     # Download file and compute MD5 check sum
     def transfer(self, rpath, lpath, remote):
         if not self.is_connected:
@@ -306,6 +355,15 @@ class FTPserver:
                 uploaded.append(name)
         return uploaded
 
+    # Copy files to local folder (root). Stand-in for data center when testing uploads.
+    def upload_local(self, lst, testing=False):
+        uploaded = []
+        os.makedirs(folder := os.path.expanduser(self.root), exist_ok=True)
+        for path in [os.path.expanduser(path) for path in lst if os.path.exists(path)]:
+            shutil.copy2(path, os.path.join(folder, name := os.path.basename(path)))
+            uploaded.append(name)
+        return uploaded
+
 # Generic class for HTTP and HTTPS server
 class HTTPserver(FTPserver):
 
@@ -343,6 +401,17 @@ class HTTPserver(FTPserver):
             self.add_error('could not connect to {} [{}]'.format(self.url, str(err)))
         return False
 
+    # Close requests session
+    def close(self):
+        if self.session:
+            self.session.close()
+            self.session = None
+        super().close()
+
+    # Requests session reconnects by itself when connection has been dropped
+    def is_alive(self):
+        return self.connected and self.session is not None
+
     # Loop all columns to find datetime compatible string
     def decode_web_time(self, row):
         for col in row.find_all('td'):
@@ -447,6 +516,61 @@ class HTTPserver(FTPserver):
             self.add_error('download {} failed: [{}]'.format(rpath, str(err)))
             return False, self.errors
 
+    # Extract fingerprint of file from http headers
+    def decode_fingerprint(self, headers):
+        info = dict(size=None, mtime=None, etag=headers.get('ETag', None))
+        try:
+            info['size'] = int(headers['Content-Length'])
+        except (KeyError, ValueError):
+            pass
+        try:
+            file_time = headers['Last-Modified'].strip()
+            zone = pytz.timezone(file_time.split()[-1].strip())
+            info['mtime'] = int(zone.localize(datetime.strptime(file_time, self.TIMEfmt)).timestamp())
+        except Exception:
+            pass
+        return info
+
+    # Get size, modified time and etag of remote file using HEAD request
+    def get_fingerprint(self, rpath):
+        try:
+            with self.session.head(urljoin(self.url, rpath), cookies=self.jar, allow_redirects=True) as r:
+                if r.status_code == 200:
+                    return self.decode_fingerprint(r.headers)
+        except Exception:
+            pass
+        return dict(size=None, mtime=None, etag=None)
+
+    # Download file using If-None-Match and If-Modified-Since headers. Body is not read if file has not changed.
+    # Return ok, md5 (or NOT_MODIFIED or errors) and fingerprint of remote file
+    def conditional_download(self, rpath, lpath, fingerprint=None):
+        if not self.is_connected:
+            self.add_error(f'{self.code} not connected')
+            return False, self.errors, None
+        headers = {}
+        if fingerprint and fingerprint.get('etag'):
+            headers['If-None-Match'] = fingerprint['etag']
+        if fingerprint and fingerprint.get('mtime'):
+            headers['If-Modified-Since'] = formatdate(fingerprint['mtime'], usegmt=True)
+        try:
+            md5 = hashlib.md5()
+            with self.session.get(urljoin(self.url, rpath), cookies=self.jar, stream=True, headers=headers) as r:
+                if r.status_code == 304:
+                    return False, NOT_MODIFIED, fingerprint
+                r.raise_for_status()
+                # Some servers ignore conditional headers
+                if same_fingerprint(fingerprint, remote := self.decode_fingerprint(r.headers)):
+                    return False, NOT_MODIFIED, remote
+                with open(lpath, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        if chunk:  # filter out keep-alive new chunks
+                            md5.update(chunk)
+                            f.write(chunk)
+            return True, md5.hexdigest(), remote
+        except Exception as err:
+            self.add_error('download {} failed: [{}]'.format(rpath, str(err)))
+            return False, self.errors, None
+
     # Download file using request and compute md5 checksum
     def transfer(self, rpath, lpath, remote):
         if not self.is_connected:
@@ -482,6 +606,10 @@ class CURLftp(HTTPserver):
         self.connected = True
         return True
 
+    # Curl handle reconnects by itself when connection has been dropped
+    def is_alive(self):
+        return self.connected
+
     # Detect if file exist and provide timestamp
     def get_file_info(self, rpath):
         # Request file time
@@ -499,6 +627,33 @@ class CURLftp(HTTPserver):
         except Exception as err:
             return False, 0
 
+    # Get size and modified time of remote file without transferring body
+    def get_fingerprint(self, rpath):
+        info, buffer = dict(size=None, mtime=None, etag=None), BytesIO()
+        try:
+            self.host.setopt(pycurl.OPT_FILETIME, True)
+            self.host.setopt(pycurl.NOBODY, True)
+            self.host.setopt(pycurl.HEADER, False)
+            self.host.setopt(pycurl.HEADERFUNCTION, buffer.write)
+            self.host.setopt(pycurl.URL, urljoin(self.url, rpath))
+            self.host.setopt(pycurl.WRITEFUNCTION, lambda data: len(data))
+            self.host.perform()
+            if (file_time := self.host.getinfo(pycurl.INFO_FILETIME)) > 0:
+                info['mtime'] = int(file_time)
+            if (size := self.host.getinfo(pycurl.CONTENT_LENGTH_DOWNLOAD)) >= 0:
+                info['size'] = int(size)
+            for line in buffer.getvalue().decode('utf-8', errors='ignore').splitlines():
+                if line.lower().startswith('etag:'):
+                    info['etag'] = line.split(':', 1)[-1].strip()
+        except Exception:
+            pass
+        self.host.setopt(pycurl.HEADERFUNCTION, lambda data: len(data))
+        return info
+
+    # Compare fingerprints before downloading (no conditional request with curl)
+    def conditional_download(self, rpath, lpath, fingerprint=None):
+        return FTPserver.conditional_download(self, rpath, lpath, fingerprint)
+
     # List files in directory with their timestamp
     def listdir(self, folder):
 
@@ -684,6 +839,65 @@ def get_server(category, code):
         return FTPserver({})
 
 
+# Pool of connected servers kept by a worker and shared by all download functions.
+# Connections are reused if used within idle_timeout and still alive.
+class ServerPool:
+
+    def __init__(self, idle_timeout=300):
+        self.idle_timeout = idle_timeout
+        self.servers = {}  # (category, code) -> (server, last used, config modified time)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Get connected server from pool or open a new connection
+    def acquire(self, category, code):
+        load_servers(category)
+        if item := self.servers.pop((category, code), None):
+            server, last_used, mod_time = item
+            if mod_time == last_mod_time and (time.time() - last_used) < self.idle_timeout and server.is_alive():
+                return server
+            server.close()
+        server = get_server(category, code)
+        server.connect()
+        return server
+
+    # Return server to pool
+    def release(self, category, code, server):
+        if server.is_connected:
+            self.servers[(category, code)] = (server, time.time(), last_mod_time)
+        else:
+            server.close()
+
+    # Use pool connection with 'with pool.connection() as server'
+    @contextmanager
+    def connection(self, category, code):
+        server = self.acquire(category, code)
+        try:
+            yield server
+        except Exception:
+            server.close()  # State of connection is unknown
+            raise
+        self.release(category, code, server)
+
+    # Close connections that have not been used within idle_timeout
+    def clean(self):
+        now = time.time()
+        for key, (server, last_used, _) in list(self.servers.items()):
+            if now - last_used >= self.idle_timeout:
+                server.close()
+                self.servers.pop(key)
+
+    # Close all connections
+    def close(self):
+        for server, *_ in self.servers.values():
+            server.close()
+        self.servers = {}
+
+
 # Get ftp or http server
 def get_aliases(category, code):
     global configurations
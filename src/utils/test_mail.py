@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip('googleapiclient')
+
+from utils.mail import MailTransport, MailQueue, build_message
+
+
+# Duplicate messages are sent once to local stand-in and Cc addresses are in envelope
+def test_queue_local_smtp(tmp_path):
+    server, errors = f'local:{tmp_path}', []
+    mail_queue = MailQueue(MailTransport(), window=60, on_error=errors.append)
+    msg = build_message('aps <aps@example.org>', ['ops@example.org'], 'R41050 ready', copy_to=['cc@example.org'],
+                        text='vgosDB is ready')
+    assert mail_queue.put(server, msg)
+    assert not mail_queue.put(server, msg)
+    mail_queue.flush()
+    mail_queue.close()
+
+    files = list(tmp_path.glob('*.eml'))
+    assert not errors
+    assert len(files) == 1
+    envelope = files[0].read_text().splitlines()[:2]
+    assert envelope == ['X-Envelope-From: aps@example.org', 'X-Envelope-To: ops@example.org, cc@example.org']
@@ -4,6 +4,7 @@ from pytz import UTC
 import os
 import re
 from collections import defaultdict
+from bisect import bisect_left
 
 import numpy as np
 from netCDF4 import Dataset
@@ -422,12 +423,24 @@ class VGOSdb:
             sources[src] += 1
         return sources
 
-    def get_uncorrelated_observations(self, schedule):
-        corr, not_corr = defaultdict(list), []
+    # Get sorted times of correlated observations using baseline-source as key
+    def get_correlated_times(self):
+        corr = defaultdict(list)
         for index, bl, src, utc, qc_x, qc_s, fc_x, fc_s, flg in self.get_all_obs():
-            key = f'{bl[0]}:{bl[1]}:{src}'
-            # Store time of each scan
-            corr[key].append(utc)
+            corr[f'{bl[0]}:{bl[1]}:{src}'].append(utc)
+        for times in corr.values():
+            times.sort()
+        return corr
+
+    # Test if one correlated time is between start and stop
+    @staticmethod
+    def is_correlated(times, start, stop):
+        index = bisect_left(times, start)
+        return index < len(times) and times[index] <= stop
+
+    # Get source and start time of scheduled observations that have not been correlated
+    def get_uncorrelated_scans(self, schedule, corr=None):
+        corr = self.get_correlated_times() if corr is None else corr
         # Get list of removed stations
         removed = set(schedule.missed) | set(self.deselected_st)
         # Extract list of uncorrelated scans.
@@ -445,12 +458,14 @@ class VGOSdb:
             duration = min(scan['station_codes'][fr]['duration'], scan['station_codes'][to]['duration'])
             start = scan['start']
             stop = start + timedelta(seconds=duration)
-            key = f'{fr_name}:{to_name}:{obs["scan"]["source"]}'
-            if key not in corr:
-                key = '{}:{}:{}'.format(to_name, fr_name, obs['scan']['source'])
-            if key not in corr or not any([start <= t <= stop for t in corr[key]]):
-                not_corr.append(f"    observation of {obs['scan']['source']:8s} at {start.strftime('%H:%M:%S')}")
-        return not_corr
+            if (key := f'{fr_name}:{to_name}:{scan["source"]}') not in corr:
+                key = f'{to_name}:{fr_name}:{scan["source"]}'
+            if key not in corr or not self.is_correlated(corr[key], start, stop):
+                yield scan['source'], start
+
+    def get_uncorrelated_observations(self, schedule):
+        return [f"    observation of {source:8s} at {start.strftime('%H:%M:%S')}"
+                for source, start in self.get_uncorrelated_scans(schedule)]
 
     # Get list of not usable observations
     def get_rejected_obs(self, unusable, excluded):
@@ -0,0 +1,251 @@
+import sqlite3
+import os
+import logging
+from datetime import datetime
+
+from netCDF4 import Dataset
+
+from utils import app
+from utils.utctime import utc
+from vgosdb import get_db_name
+from vgosdb.wrapper import Wrapper
+
+logger = logging.getLogger(__name__)
+
+
+# Path of catalog database. Could be set in VLBIfolders section of config file
+def catalog_path():
+    return getattr(app.VLBIfolders, 'catalog', os.path.join(app.VLBIfolders.vgosdb, 'catalog.sqlite3'))
+
+
+# Class to store information on all vgosDB in archive (sqlite database)
+class VGOScatalog:
+
+    Tables = ["CREATE TABLE IF NOT EXISTS vgosdbs (db_name TEXT PRIMARY KEY, year TEXT, folder TEXT, code TEXT, "
+              "session TEXT, create_time TEXT, mtime REAL)",
+              "CREATE TABLE IF NOT EXISTS wrappers (db_name TEXT, name TEXT, version TEXT, agency TEXT, "
+              "subset TEXT, time_tag TEXT, mtime REAL, PRIMARY KEY (db_name, name))",
+              "CREATE TABLE IF NOT EXISTS processes (db_name TEXT, wrapper TEXT, name TEXT, runtimetag TEXT, "
+              "history TEXT, PRIMARY KEY (db_name, wrapper, name))",
+              "CREATE INDEX IF NOT EXISTS wrappers_info ON wrappers (agency, version, subset)"]
+
+    def __init__(self, path=None):
+        self.path = path if path else catalog_path()
+        self.con = sqlite3.connect(self.path, timeout=60)
+        for sql in self.Tables:
+            self.con.execute(sql)
+        self.con.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    # Read Head.nc file to get create time and session name
+    @staticmethod
+    def read_head(folder, wrapper):
+        create_time, session = None, ''
+        if wrapper and (head := wrapper.get_head()) and os.path.exists(path := os.path.join(folder, head)):
+            try:
+                with Dataset(path, 'r') as src:
+                    created = src.variables['CreateTime'][:].tostring().decode('utf-8').replace(' UTC', '')
+                    create_time = utc(vgosdb=created)
+                    if 'Session' in src.variables:
+                        session = src.variables['Session'][:].tostring().decode('utf-8').upper()
+            except Exception:
+                pass
+        return create_time, session
+
+    # Read all wrappers in vgosDB folder
+    @staticmethod
+    def read_wrappers(folder):
+        wrappers = []
+        for filename in os.listdir(folder):
+            if filename.endswith('.wrp'):
+                with Wrapper(os.path.join(folder, filename)) as wrp:
+                    if wrp.version:
+                        wrp.read()
+                        wrappers.append(wrp)
+        return wrappers
+
+    # Add or replace information for one vgosDB folder. VGOSdb instance could be used to avoid reading files again.
+    def update(self, folder, vgosdb=None, code=None, commit=True):
+        folder = str(folder).rstrip('/')
+        try:
+            db_name = get_db_name(os.path.basename(folder))['name']
+        except TypeError:
+            return False
+        if vgosdb:
+            vgosdb.get_wrappers()
+            wrappers, create_time, session = vgosdb.wrappers, vgosdb.create_time, vgosdb.session
+            code = code if code else vgosdb.code
+        else:
+            wrappers = self.read_wrappers(folder)
+            latest = max(wrappers, key=lambda w: (w.version, w.time_tag)) if wrappers else None
+            create_time, session = self.read_head(folder, latest)
+        year = os.path.basename(os.path.dirname(folder))
+
+        self.con.execute("DELETE FROM wrappers WHERE db_name = ?", (db_name,))
+        self.con.execute("DELETE FROM processes WHERE db_name = ?", (db_name,))
+        self.con.execute("INSERT OR REPLACE INTO vgosdbs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (db_name, year, folder, code, session, create_time.isoformat() if create_time else None,
+                          os.stat(folder).st_mtime))
+        self.con.executemany("INSERT OR REPLACE INTO wrappers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [(db_name, wrp.name, wrp.version, wrp.agency, wrp.subset, wrp.time_tag.isoformat(),
+                               os.stat(os.path.join(folder, wrp.name)).st_mtime) for wrp in wrappers])
+        self.con.executemany("INSERT OR REPLACE INTO processes VALUES (?, ?, ?, ?, ?)",
+                             [(db_name, wrp.name, name, prc['runtimetag'].isoformat() if prc.get('runtimetag') else None,
+                               prc.get('history', '')) for wrp in wrappers for name, prc in wrp.processes.items()])
+        if commit:
+            self.con.commit()
+        return True
+
+    # Remove vgosDB from catalog
+    def remove(self, db_name, commit=True):
+        for table in ('vgosdbs', 'wrappers', 'processes'):
+            self.con.execute(f"DELETE FROM {table} WHERE db_name = ?", (db_name,))
+        if commit:
+            self.con.commit()
+
+    # Scan vgosDB folders and update catalog for folders modified since last scan
+    def scan(self, years=None, dbase=None):
+        root = app.VLBIfolders.vgosdb
+        years = [str(year) for year in years] if years else [year for year in os.listdir(root) if year.isdigit()]
+        updated = 0
+        for year in years:
+            known = {db_name: mtime for db_name, mtime in
+                     self.con.execute("SELECT db_name, mtime FROM vgosdbs WHERE year = ?", (year,))}
+            if not os.path.isdir(folder := os.path.join(root, year)):
+                continue
+            for entry in os.scandir(folder):
+                if not entry.is_dir() or not (found := get_db_name(entry.name)) or found['name'] != entry.name:
+                    continue  # Renamed folders (.p1, ...) are not in catalog
+                if known.pop(entry.name, None) != entry.stat().st_mtime:
+                    code = dbase.get_db_session_code(entry.name) if dbase else None
+                    updated += self.update(entry.path, code=code, commit=False)
+            for db_name in known:  # Folders that have been removed
+                self.remove(db_name, commit=False)
+            self.con.commit()
+        return updated
+
+    # Get information for specific vgosDB
+    def get(self, db_name):
+        cur = self.con.execute("SELECT * FROM vgosdbs WHERE db_name = ?", (db_name,))
+        if not (row := cur.fetchone()):
+            return None
+        info = dict(zip([col[0] for col in cur.description], row))
+        info['create_time'] = datetime.fromisoformat(info['create_time']) if info['create_time'] else None
+        info['wrappers'] = self.get_wrappers(db_name)
+        return info
+
+    # Get list of wrappers (with processes) for a vgosDB
+    def get_wrappers(self, db_name):
+        wrappers = {}
+        for name, version, agency, subset, time_tag in self.con.execute(
+                "SELECT name, version, agency, subset, time_tag FROM wrappers WHERE db_name = ? ORDER BY version, "
+                "time_tag", (db_name,)):
+            wrappers[name] = dict(version=version, agency=agency, subset=subset,
+                                  time_tag=datetime.fromisoformat(time_tag), processes={})
+        for wrapper, name, runtimetag, history in self.con.execute(
+                "SELECT wrapper, name, runtimetag, history FROM processes WHERE db_name = ?", (db_name,)):
+            wrappers[wrapper]['processes'][name] = dict(
+                runtimetag=datetime.fromisoformat(runtimetag) if runtimetag else None, history=history)
+        return wrappers
+
+    # Get information for vgosDB folder. Folder is (re)indexed if not in catalog or modified since last update.
+    def lookup(self, folder):
+        if not os.path.isdir(folder):
+            return None
+        info = self.get(db_name := os.path.basename(str(folder).rstrip('/')))
+        if not info or info['mtime'] != os.stat(folder).st_mtime:
+            if not self.update(folder, code=info['code'] if info else None):
+                return None
+            info = self.get(db_name)
+        return info
+
+    # Get first wrapper for this agency (same logic as VGOSdb.get_first_wrapper)
+    @staticmethod
+    def first_wrapper(info, agency):
+        lst = [wrp for wrp in info['wrappers'].values() if wrp['agency'] == agency]
+        return min(lst, key=lambda wrp: wrp['version']) if lst else None
+
+    # Get last wrapper for this agency (same logic as VGOSdb.get_last_wrapper)
+    @staticmethod
+    def last_wrapper(info, agency):
+        lst = [wrp for wrp in info['wrappers'].values() if wrp['agency'] == agency and wrp['subset'] == 'all']
+        return max(lst, key=lambda wrp: wrp['version']) if lst else None
+
+    # Get set of db_names with a wrapper matching version, agency and subset. Modified time of wrapper could be used.
+    def find(self, version=None, agency=None, subset=None, start=None, end=None):
+        conditions, values = [], []
+        for column, value in (('version', version), ('agency', agency), ('subset', subset)):
+            if value:
+                conditions.append(f'{column} = ?')
+                values.append(value)
+        if start:
+            conditions.append('mtime >= ?')
+            values.append(start.timestamp() if isinstance(start, datetime) else start)
+        if end:
+            conditions.append('mtime <= ?')
+            values.append(end.timestamp() if isinstance(end, datetime) else end)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        return {row[0] for row in self.con.execute(f"SELECT DISTINCT db_name FROM wrappers{where}", values)}
+
+    # Get vgosDB modified since start time with the version and agency of their wrappers
+    def recent(self, start):
+        start = start.timestamp() if isinstance(start, datetime) else start
+        recent = {}
+        for db_name, year, code, mtime, version, agency in self.con.execute(
+                "SELECT v.db_name, v.year, v.code, v.mtime, w.version, w.agency FROM vgosdbs v LEFT JOIN wrappers w "
+                "ON v.db_name = w.db_name WHERE v.mtime >= ? ORDER BY v.mtime, v.db_name", (start,)):
+            info = recent.setdefault(db_name, dict(db_name=db_name, year=year, code=code, mtime=mtime, wrappers=[]))
+            if version:
+                info['wrappers'].append((version, agency))
+        return list(recent.values())
+
+    # Get set of all db_names in catalog
+    def db_names(self, year=None):
+        if year:
+            return {row[0] for row in self.con.execute("SELECT db_name FROM vgosdbs WHERE year = ?", (str(year),))}
+        return {row[0] for row in self.con.execute("SELECT db_name FROM vgosdbs")}
+
+    # Get set of db_names having a Head.nc file
+    def with_head(self):
+        return {row[0] for row in self.con.execute("SELECT db_name FROM vgosdbs WHERE create_time IS NOT NULL")}
+
+
+# Update catalog for one vgosDB folder. Errors are not critical for calling application.
+def update_catalog(folder, vgosdb=None):
+    try:
+        with VGOScatalog() as catalog:
+            return catalog.update(folder, vgosdb)
+    except Exception as exc:
+        logger.warning(f'update_catalog {folder} {str(exc)}')
+        return False
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from ivsdb import IVSdata
+
+    parser = argparse.ArgumentParser(description='Update catalog of vgosDB archive')
+    parser.add_argument('-c', '--config', help='config file', required=True)
+    parser.add_argument('-d', '--db', help='database name', default='ivscc', required=False)
+    parser.add_argument('-p', '--period', help='scan period in seconds (0 run once)', type=int, default=0)
+    parser.add_argument('years', help='years to scan', nargs='*')
+
+    args = app.init(parser.parse_args())
+
+    url, tunnel = app.get_dbase_info()
+    with IVSdata(url, tunnel) as dbase, VGOScatalog() as catalog:
+        while True:
+            print(f'{datetime.now():%Y-%m-%d %H:%M:%S} {catalog.scan(args.years, dbase)} vgosDB updated')
+            if not args.period:
+                break
+            time.sleep(args.period)
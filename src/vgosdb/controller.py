@@ -13,10 +13,11 @@ from operator import attrgetter, itemgetter
 
 from utils import app, readDICT, nc
 from utils.files import remove
-from utils.mail import build_message, send_message
-from utils.servers import get_server, get_config_item, CORRELATOR
+from utils.mail import build_message, queue_message
+from utils.servers import ServerPool, get_config_item, CORRELATOR
 from vgosdb.compress import VGOStgz
 from vgosdb import VGOSdb, vgosdb_folder, get_db_name
+from vgosdb.catalog import update_catalog
 from vgosdb.nusolve import get_nuSolve_info
 from aps import APS, submit, get_aps_process, spool
 from ivsdb import IVSdata
@@ -32,6 +33,7 @@ class VGOSDBController:
         self.agency = self.notifications = self.nusolveApps = self.auto = self.lastmod = self.origin = None
         self.vgosdb = self.moved_folder = None
         self.same_correlator_data = False
+        self.servers = ServerPool()  # Connections to correlators kept between downloads
         self.check_control_file()
 
         self.save_corr_report = app.args.corr if hasattr(app.args, 'corr') else True
@@ -54,6 +56,10 @@ class VGOSDBController:
         self.warning(msg)
         app.notify('VGOS DB', msg)
 
+    # Report email that could not be sent. Called by mail thread so Broker functions are not used.
+    def mail_error(self, err):
+        app.notify('VGOS DB', f'{self.vgosdb.name} - {err}')
+
     def check_control_file(self):
         # Read configuration file every time in case there was some changes.
         self.lastmod, info = app.load_control_file(name=app.ControlFiles.VGOSdb, lastmod=self.lastmod)
@@ -87,7 +93,7 @@ class VGOSDBController:
         errs = '\n'.join(err)
         message = f'{self.vgosdb.name} from {self.origin} is available at {self.vgosdb.folder}\n\n{summary}\n{errs}'
         msg = build_message(sender, recipients, title, text=message)
-        send_message(self.notifications['server'], msg)
+        queue_message(self.notifications['server'], msg, on_error=self.mail_error)
 
     def send_copy_email(self, comments):
         if app.args.no_mail:
@@ -109,7 +115,7 @@ class VGOSDBController:
                   f'History, wrappers and .nc files were copied from {self.moved_folder}\n\n{comments}'
 
         msg = build_message(sender, recipients, title, text=message)
-        send_message(self.notifications['server'], msg)
+        queue_message(self.notifications['server'], msg, on_error=self.mail_error)
 
     # Send message that vgosDB is ready
     def send_auto_processing_email(self, summary, err):
@@ -128,8 +134,8 @@ class VGOSDBController:
         errs = f"PROBLEMS\n--------\n{err}" if err else ''
         message = f'{self.vgosdb.name} from {self.origin} has been processed in {self.vgosdb.folder}\n\n{summary}{errs}'
         msg = build_message(sender, recipients, title, text=message)
-        ret = send_message(self.notifications['server'], msg)
-        self.info(f'{self.vgosdb.name} - send email: {ret if ret else "ok"}')
+        sent = queue_message(self.notifications['server'], msg, on_error=self.mail_error)
+        self.info(f'{self.vgosdb.name} - email {"queued" if sent else "already sent"}')
 
     # Download vgosDB file
     def download(self, center, rpath):
@@ -138,7 +144,7 @@ class VGOSDBController:
         for nbr_tries in range(5):
             # Make unique tmp file for this
             lpath = tempfile.NamedTemporaryFile(delete=False).name
-            with get_server(CORRELATOR, center) as server:
+            with self.servers.connection(CORRELATOR, center) as server:
                 ok, info = server.download(rpath, lpath)
                 if not ok or not os.stat(lpath).st_size:
                     err = f'Download failed {ok} - [{info}]'
@@ -253,6 +259,7 @@ class VGOSDBController:
                 self.processDB(folder, msg)
             except Exception as err:
                 self.notify(f'{name} {str(err)}\n{str(traceback.format_exc())}')
+            self.update_catalog(folder)
         remove(lpath)
         return True
 
@@ -268,8 +275,15 @@ class VGOSDBController:
                 self.processDB(folder, msg)
             except Exception as err:
                 self.notify(f'{db_name} {str(err)}\n{str(traceback.format_exc())}')
+            self.update_catalog(folder)
         return True
 
+    # Update vgosDB catalog with new folder. Use VGOSdb instance if it was created for this folder.
+    def update_catalog(self, folder):
+        vgosdb = self.vgosdb if self.vgosdb and self.vgosdb.folder == str(folder).rstrip('/') else None
+        if not update_catalog(folder, vgosdb):
+            self.warning(f'Could not update catalog for {folder}')
+
     def use_last_wrapper(self):
         # Check if one of the station has Cal-Cable_kPcmt.nc file
         for name in self.vgosdb.station_list:
@@ -454,6 +468,7 @@ class VGOSDBController:
                                         summary.append('Analysis report sent to IVS mail')
                 except Exception as exc:
                     aps.errors(f'APS failed {str(exc)}')
+                aps.processing.save()  # Save processing history
             self.info(f'{dbname} - end of aps')
             err = aps.errors
 
@@ -1,21 +1,74 @@
 import os
 import re
+import hashlib
 import itertools
 from pathlib import Path
 from collections import defaultdict
 from datetime import datetime
+from functools import lru_cache
 
 from utils import app
 from ivsdb import IVSdata
 
 
+OLDnames = {'NY ALESUND': 'NYALESUND', 'FORTALEZA': 'FORTLEZA', 'ALGONQUIN': 'ALGOPARK'}
+is_old_name = re.compile('|'.join(map(re.escape, OLDnames)), re.IGNORECASE)
+
+
+# Make sure the old names are not used
+def clean_old_names(text):
+    return is_old_name.sub(lambda found: OLDnames[found.group().upper()], text)
+
+
+# Rejection rules for correlator notes compiled in one regex.
+# 'exact' words reject sentence. A 'words' rule rejects sentence when all its words are in sentence.
+class NotesFilter:
+
+    def __init__(self, rej_words, rej_exact):
+        self.rules = [(rule, set(rule.split())) for rule in rej_words]
+        self.exact = {word for word in rej_exact if word}
+        words = self.exact.union(*[words for _, words in self.rules])
+        # Lookahead finds the longest word starting at each position. Shorter words included in it are added after.
+        pattern = '|'.join(map(re.escape, sorted(words, key=len, reverse=True)))
+        self.find_all = re.compile(f'(?=({pattern}))').findall if words else lambda text: []
+        self.included = {word: {other for other in words if other in word} for word in words}
+        self.rules_by_word = defaultdict(list)
+        for index, (_, rule_words) in enumerate(self.rules):
+            for word in rule_words:
+                self.rules_by_word[word].append(index)
+
+    # Get all rejection words found in sentence
+    def find_words(self, sentence):
+        return set().union(*[self.included[word] for word in set(self.find_all(sentence))])
+
+    # Return rule rejecting sentence, True for exact word or None if not rejected
+    def rejected_by(self, sentence):
+        if not (found := self.find_words(sentence)):
+            return None
+        if found & self.exact:
+            return True
+        for index in sorted({index for word in found for index in self.rules_by_word[word]}):
+            if self.rules[index][1] <= found:
+                return self.rules[index][0]
+        return None
+
+
+# Get filter compiled for these rules. Same filter is shared by all sessions.
+@lru_cache(maxsize=8)
+def get_notes_filter(rej_words, rej_exact):
+    return NotesFilter(rej_words, rej_exact)
+
+
 # Read correlator report, Report is stored as text.
 class CorrelatorReport:
+    is_format = re.compile(r'(%CORRELATOR_REPORT_FORMAT \d)').search
+
     def __init__(self, path):
         self.path = Path(path) if isinstance(path, str) else path
         self.ses_id, self.db_name = 'unknown', 'unknown'
         self.is_template, self.text = False, ''
         self.format_version = None
+        self.lines, self.sections, self.decoded, self.digest, self.is_read = [], {}, {}, None, False
 
     def __enter__(self):
         self.read()
@@ -25,30 +78,67 @@ class CorrelatorReport:
         pass
 
     def __eq__(self, other):
-        if not self.text:
-            self.read()
-        if not other.text:
-            other.read()
-
-        return self.format_version == other.format_version and self.text == other.text
+        self.read()
+        other.read()
+        return self.digest == other.digest
 
+    # Read file once. Text is between +HEADER and last +END. Index of +SECTION lines is made while reading.
     def read(self):
+        if self.is_read:
+            return True
+        self.is_read = True
         if not self.path.exists():
             self.format_version, self.text = 'missing', 'none'
+            self.digest = self.make_digest()
             return True
+        lines, last_end = [], None
         with open(self.path, errors='ignore') as f:
-            content = f.read()
-            if found := re.search(r'(%CORRELATOR_REPORT_FORMAT \d)', content):
-                self.format_version = found.group()
-            if text := re.search(r'(\+HEADER(.*)\+END)', content, re.DOTALL):
-                self.text = text.group()
-                if ses_id := re.search(r'SESSNAME|SESSION +(.*)', self.text):
-                    self.ses_id = ses_id.groups()[0]
-                if db_name := re.search(r'(DATABASE|VGOSDB)(.*)', self.text):
-                    self.db_name = db_name.group().split()[-1].strip()
-                self.is_template = bool(re.findall('<comment here>', self.text))
-                self.text = '\n'.join([line.lstrip() for line in self.text.splitlines()])
-            return True
+            for line in f:
+                if not self.format_version and (found := self.is_format(line)):
+                    self.format_version = found.group()
+                if not lines:
+                    if (index := line.find('+HEADER')) < 0:
+                        continue
+                    line = line[index:]
+                for segment in line.splitlines():
+                    if (index := segment.rfind('+END')) > -1:
+                        last_end = (len(lines), index + 4)
+                    lines.append(segment)
+        if last_end:
+            lines, (last, index) = lines[:last_end[0] + 1], last_end
+            lines[last] = lines[last][:index]
+            text = '\n'.join(lines)
+            if ses_id := re.search(r'SESSNAME|SESSION +(.*)', text):
+                self.ses_id = ses_id.groups()[0]
+            if db_name := re.search(r'(DATABASE|VGOSDB)(.*)', text):
+                self.db_name = db_name.group().split()[-1].strip()
+            self.is_template = '<comment here>' in text
+            self.lines = [line.lstrip() for line in lines]
+            self.text = '\n'.join(self.lines)
+            # Index of sections. A section ends at the next line starting with +
+            start, name = None, None
+            for index, line in enumerate(self.lines + ['+']):
+                if line.startswith('+'):
+                    if name and name not in self.sections:
+                        self.sections[name] = (start, index)
+                    start, name = index, line.split()[0]
+        self.digest = self.make_digest()
+        return True
+
+    # Hash of format and text used to compare reports
+    def make_digest(self):
+        return hashlib.md5(f'{self.format_version}\n{self.text}'.encode('utf-8')).hexdigest()
+
+    # Get lines of section. First item is the rest of +SECTION line. Section is decoded only when needed.
+    # Name is matched by prefix (+STATION finds +STATIONS) when there is no section with that exact name.
+    def get_section(self, name):
+        self.read()
+        if name not in self.decoded:
+            if not (found := self.sections.get(name)):
+                found = next((item for key, item in self.sections.items() if key.startswith(name)), (0, 0))
+            start, end = found
+            self.decoded[name] = [self.lines[start][len(name):]] + self.lines[start+1:end] if end else None
+        return self.decoded[name]
 
     def write(self, path):
         if self.format_version != 'missing':
@@ -58,11 +148,9 @@ class CorrelatorReport:
                 print(self.text, file=f)
 
     def save(self, path):
-        if not self.text:
-            self.read()
+        self.read()
         if os.path.exists(path):
             with CorrelatorReport(path) as old:
-                old.read()
                 if self == old:
                     return False, 'MD5 same'
                 # Move old report
@@ -74,20 +162,17 @@ class CorrelatorReport:
         return True, 'updated'
 
     def decode_old_format(self, network, names):
-        # Make sure the old names are not used
-        def clean_old_names(text):
-            for old_name, new_name in {'NY ALESUND': 'NYALESUND', 'FORTALEZA': 'FORTLEZA',
-                                       'ALGONQUIN': 'ALGOPARK'}.items():
-                text = re.sub(old_name, new_name, text, re.IGNORECASE)
-            return text
-
         def decode_line(text):
             if (text := text.strip()) and (words := text.split())[0] in network:
                 return words[0], text.split(':', 1)[1].strip()
             return '', text.strip()
         comments = {code: [''] for code in network}
-        if info := re.search(r'\+STATION[ _]NOTES(.*)', self.text, re.DOTALL):
-            lines = list(itertools.takewhile(lambda x: not x.startswith(('+', '$')), info.groups()[0].splitlines()))
+        # Section could be +STATION_NOTES or +STATION NOTES
+        section = self.get_section('+STATION_NOTES')
+        if section is None and (section := self.get_section('+STATION')) and not section[0].startswith(' NOTES'):
+            section = None
+        if section is not None:
+            lines = list(itertools.takewhile(lambda x: not x.startswith(('+', '$')), section[1:]))
             last = None
             for line in lines:
                 code, comment = decode_line(clean_old_names(line))
@@ -106,14 +191,15 @@ class CorrelatorReport:
         for code in network:
             comments[code].append('')
 
-        if info := re.search(r'\+STATION(.*)\+NOTES(.*)\+CLOCK(.*)', self.text, re.DOTALL):
-            for line in info.groups()[0].splitlines():
+        if (stations := self.get_section('+STATION')) is not None and (notes := self.get_section('+NOTES')) is not None \
+                and self.get_section('+CLOCK') is not None:
+            for line in stations:
                 if not line.startswith('*') and len(values := line.split()) == 3:
                     if (code := values[0]) in codes and code not in network:
                         network[code] = values[1]
                         comments[code].append('')
 
-            for line in info.groups()[1].splitlines():
+            for line in notes:
                 if line and not line.startswith('*'):
                     try:
                         code, comment = line.split(maxsplit=1)
@@ -128,16 +214,9 @@ class CorrelatorReport:
 
         return comments, extra
 
-    def clean(self, rej_words, rej_exact, paragraph):
+    def clean(self, notes_filter, paragraph):
         get_missed = re.compile(r'(\d{3}\-\d{4}[ a-zA-Z])(\-\-|through|and) (\d{3}\-\d{4}[ a-zA-Z]*)').findall
 
-        # Check if sentence must be rejected
-        def is_rejected(not_interesting_words, text):
-            for w in not_interesting_words.split():
-                if w not in text:
-                    return False
-            return True
-
         def get_cause(text):
             if (index := text.find(' due ')) > -1:
                 text = text[index:]
@@ -174,18 +253,12 @@ class CorrelatorReport:
         for phrase in paragraph.split('. '):
             if (sentence := phrase.lower()).startswith(('ok', 'no problems')):
                 continue
-            for word in rej_exact:
-                if word in sentence:
-                    phrase = ''
-                    break
-            if phrase:
-                for words in rej_words:
-                    if is_rejected(words, sentence):
-                        phrase = decode_data_minus(sentence) if words == 'data minus' else ''
-                        break
-                else:
-                    if ('scan' in sentence and 'missed' in sentence) or 'no data' in sentence:
-                        phrase = decode_data_minus(sentence)
+            if (rule := notes_filter.rejected_by(sentence)) == 'data minus':
+                phrase = decode_data_minus(sentence)
+            elif rule:
+                phrase = ''
+            elif ('scan' in sentence and 'missed' in sentence) or 'no data' in sentence:
+                phrase = decode_data_minus(sentence)
 
             if phrase := phrase.strip():
                 phrases.append(phrase[0].upper() + phrase[1:])
@@ -206,10 +279,9 @@ class CorrelatorReport:
 
         clean_notes = {}
         try:
-            if not self.text:
-                self.read()
+            self.read()
             rejected = app.Applications.APS['CorrNotes']
-            rej_words, rej_exact = rejected['words'], rejected['exact']
+            notes_filter = get_notes_filter(tuple(rejected['words']), tuple(rejected['exact']))
 
             if self.format_version == 'missing':  # No corr file use list of station
                 notes, extra = self.no_corr_file(network)
@@ -236,7 +308,7 @@ class CorrelatorReport:
                 paragraph = ' '.join([f'{comment}{"" if comment.endswith(".") else "."}' for comment in comments
                                       if comment.strip()]).strip()
                 if apply_filter:
-                    paragraph = self.clean(rej_words, rej_exact, paragraph)
+                    paragraph = self.clean(notes_filter, paragraph)
                 if paragraph or not session.is_intensive:
                     clean_notes[code] = paragraph
 
@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from vgosdb.correlator import CorrelatorReport
+
+V3sample = """%CORRELATOR_REPORT_FORMAT 3
++HEADER
+SESSION      R41050
+VGOSDB       20220425-r41050
++SUMMARY
++STATIONS
+* station code and name
+Kk  KOKEE    Kk
+Wz  WETTZELL Wz
++NOTES
+Kk  Lost 10 minutes due to rain.
+Wz  Fine.
++CLOCK
+Kk  0.0
++END
+"""
+
+
+# Regression check: v3 reports have +STATIONS section, not +STATION
+def test_v3_station_notes(tmp_path):
+    path = tmp_path / 'r41050.corr'
+    path.write_text(V3sample)
+    network = {'Kk': 'KOKEE', 'Wz': 'WETTZELL'}
+    with CorrelatorReport(str(path)) as corr:
+        comments, extra = corr.decode_v3_format(network, dict(network))
+    assert comments == {'Kk': ['', 'Lost 10 minutes due to rain.'], 'Wz': ['', 'Fine.']}
+    assert not extra
@@ -1,11 +1,9 @@
 import AdvancedHTMLParser
 from AdvancedHTMLParser import AdvancedTag
 from datetime import datetime, timedelta
-from utils.servers import get_server
-import tarfile
-import tempfile
 import os
-from pathlib import Path
+
+from vgosdb.catalog import VGOScatalog
 
 
 class STATIONstats:
@@ -61,50 +59,24 @@ class STATIONstats:
 
         return self.parser.getFormattedHTML('\t')
 
-    # Update page with list of recent vgosDB
-    def make(self, db, rfolder):
-        lfolder = tempfile.gettempdir()
-
-        # Find latest files since last 2 weeks
-        date = (datetime.now() - timedelta(days=14)).strftime('%Y-%m-%d')
+    # Update page with list of recent vgosDB. Wrappers are read from vgosDB catalog filled when vgosDB are downloaded.
+    # url is the data center url and rfolder the vgosDB folder on this data center.
+    def make(self, url, rfolder, days=14, catalog_path=None):
+        # Find vgosDB updated since last 2 weeks
+        start = datetime.now() - timedelta(days=days)
 
         try:  # Create web page using template
-            centers = ['cddis', 'bkg', 'opar']
-            for file in db.get_recent_files('[0-9]{2}[A-Z]{3}[0-9]{2}[A-Z]{2}[.]', date):
-                wrappers = []
-                year = int(file.code[0:2])
-                year = year + 2000 if year < 50 else 1900;
-                rpath = os.path.join(rfolder, str(year), file.code)
-                lpath = os.path.join(lfolder, 'web_' + file.code)
-                db_name = Path(file.code).stem
-                name = db.get_db_session_code(db_name)
-                if not name:
+            with VGOScatalog(catalog_path) as catalog:
+                recent = catalog.recent(start)
+            for info in recent:
+                if not (name := info['code']):
                     continue
-                link = os.path.join('/sessions', str(year), name)
-
-                for center in centers:
-                    with get_server(center) as server:
-                        ok, err = server.download(rpath, lpath)
-                        if ok:
-                            url = server.url + rpath
-                            break
-
-                if ok:
-                    with tarfile.open(lpath) as tar:
-                        for member in tar.getmembers():
-                            if member.name.endswith('.wrp'):
-                                info = member.name.split('_')
-                                if info[1][0] == 'V' and info[2][0] == 'i':
-                                    wrappers.append('{}({})'.format(info[1], info[2][1:]))
-                    wrappers.sort()
-
-                    self.add(db_name, url, name, link, file.timestamp, wrappers)
-                    os.remove(lpath)
+                db_name, year = info['db_name'], info['year']
+                link = os.path.join('/sessions', year, name)
+                rpath = os.path.join(rfolder, year, f'{db_name}.tgz')
+                wrappers = sorted({f'{version}({agency})' for version, agency in info['wrappers']})
+                self.add(db_name, url + rpath, name, link, info['mtime'], wrappers)
 
-            return ok, self.make_html()
+            return True, self.make_html()
         except Exception as err:
             return False, str(err)
-
-
-
-